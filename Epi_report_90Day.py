@@ -3,16 +3,20 @@ import pandas as pd
 import os
 import warnings
 import re
+from concurrent.futures import ProcessPoolExecutor
+from run_metrics import start_run, stage, finish_run
+from share_cache import share_path, mirror_path, prefetch, staging_path, upload, wait_for_uploads, evict_share_cache
+from file_utils import file_lock, atomic_write
+from window_store import store_folder, store_lock, file_source, file_state, file_entry, window_columns, load_sources, save_sources, append_records, remove_files, clear_store, evict_partitions, list_organisms, read_window
+from pulsenet_schema import rename_col_lst, columns_to_remove, csv_headers, upload_date_column, input_columns, input_schema, read_dtypes, apply_schema
 
 # Suppresses all warnings
 warnings.filterwarnings('ignore')
 
-
-def convert_datetime_to_date(df):
-        """Convert datetime columns to date-only format."""
-        for col in df.select_dtypes(include=['datetime64', 'datetime']):
-            df[col] = df[col].dt.date
-        return df
+# Specify the paths to the directory, see share_cache.share_path to point them at another root
+csv_directory = share_path("//kdhe/dfs/LabShared/Molecular_Genomics_Unit/Testing/PulseNet/PulseNet 2.0/PNExports")
+xlsx_directory = share_path("//kdhe/dfs/LabShared/Molecular_Genomics_Unit/Testing/PulseNet/PulseNet 2.0/WGS_Databases")
+output_path = share_path("//kdhe/dfs/EPI/LAB_OSE/WGS")
 
 
 def extract_organism_name(filename, run_date):
@@ -36,50 +40,166 @@ def extract_organism_name(filename, run_date):
     return organism_name[:30]
     
 
-def merge_files_to_sheets(csv_directory,xlsx_directory, run_date):
+def read_input_file(file_path, run_date):
+    """
+    Reads one input file for merge_files_to_sheets. The columns of the organism's input schema are read with their
+    declared types and dates are kept as datetime64 values. Columns format_df removes are not read, any other column
+    is read untyped so it is kept after the CSV headers. Excel files are reduced to the rows with a "PulseNet Upload Date".
+    This runs in a worker process, so problems are returned as a message instead of being printed.
+    
+    Parameters:
+        file_path (str): Path to the .xlsx or .csv file.
+        run_date (str): Date of the download in mmddyy format, used to extract organism names.
+    
+    Returns:
+        tuple: The sheet name, the DataFrame (None when the file is skipped) and a message to report (None when there is nothing to report).
+    """
+    file = os.path.basename(file_path)
+    sheet_name = extract_organism_name(file, run_date) # To get the sheet name based on the organisms
+    columns = set(input_columns(sheet_name))
+    schema = input_schema(sheet_name)
+    # The upload date is removed by format_df but needed to filter the databases
+    usecols = lambda col: col in columns or col not in columns_to_remove
+    try:
+        if file.endswith('.xlsx'):
+            # Read only the first sheet
+            sheets = pd.read_excel(file_path, sheet_name=0, usecols=usecols, dtype=read_dtypes(schema))
+            # Check if "PulseNet Upload Date" column exists and filter non-empty rows
+            if upload_date_column not in sheets.columns:
+                return sheet_name, None, f"'{upload_date_column}' column not found in {file}. Skipping."
+            sheets = sheets[sheets[upload_date_column].notna() & (sheets[upload_date_column] != '')]
+            # Only proceed if there are valid rows
+            return sheet_name, (apply_schema(sheets.copy(), schema) if not sheets.empty else None), None
+        else:
+            df = pd.read_csv(file_path, usecols=usecols, dtype=read_dtypes(schema))
+            return sheet_name, apply_schema(df, schema), None
+    except Exception as e:
+        return sheet_name, None, f"Error processing {file}: {e}"
+
+
+def list_input_files(csv_directory, xlsx_directory, run_date):
+    """Returns every .xlsx file of the databases folder, then the .csv exports of run_date."""
+    excel_files = [os.path.join(xlsx_directory, file) for file in os.listdir(xlsx_directory) if file.endswith('.xlsx')]
+    csv_files = [os.path.join(csv_directory, file) for file in os.listdir(csv_directory) if file.endswith('.csv') and run_date in file]
+    return excel_files + csv_files
+
+
+def read_input_files(input_files, run_date, max_workers=None):
+    """
+    Reads input files with read_input_file. The files are first copied to the local cache (unchanged files are not
+    copied again), then read concurrently in a bounded process pool.
+    
+    Parameters:
+        input_files (list): Paths to the .xlsx and .csv files.
+        run_date (str): Date of the download in mmddyy format, used to extract organism names.
+        max_workers (int): Number of files read at the same time, defaults to the number of CPUs (at most 8).
+    
+    Returns:
+        list: (path, sheet name, DataFrame, message) of every file in the given order, the path being the one given.
+    """
+    if max_workers is None:
+        max_workers = min(8, os.cpu_count() or 1)
+    max_workers = max(1, min(max_workers, len(input_files)))
+
+    results = []
+    with stage("prefetch", files_in=len(input_files)):
+        local_files = prefetch(input_files)
+    with stage("ingest", files_in=len(input_files)) as record:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(read_input_file, file_path, run_date) for file_path in local_files]
+            for file_path, future in zip(input_files, futures):
+                try:
+                    sheet_name, df, message = future.result()
+                except Exception as e:
+                    sheet_name, df, message = None, None, f"Error processing {os.path.basename(file_path)}: {e}"
+                if message:
+                    print(message)
+                results.append((file_path, sheet_name, df, message))
+        record["rows_out"] = sum(len(df) for _, _, df, _ in results if df is not None)
+    return results
+
+
+def merge_files_to_sheets(csv_directory,xlsx_directory, run_date, max_workers=None):
     """
     Merges the first sheet from all .xlsx files and all .csv files from the two different directory into a single dictionary of DataFrames with multiple sheets.
+    The files are read with read_input_files and every organism is concatenated once, in file order.
     
     Parameters:
-        input_directory (str): Path to the directory containing .xlsx and .csv files.
+        csv_directory (str): Path to the directory containing the .csv exports.
+        xlsx_directory (str): Path to the directory containing the .xlsx databases.
         run_date (str): Date of the download in mmddyy format, used to extract organism names.
+        max_workers (int): Number of files read at the same time, defaults to the number of CPUs (at most 8).
     
     Returns:
         dict: A dictionary of DataFrames, each corresponding to a sheet.
     """
-    combined_sheets = {}
-
-    # Merge the first sheet from Excel files
-    excel_files = [file for file in os.listdir(xlsx_directory) if file.endswith('.xlsx')]
-    for file in excel_files:
-        file_path = os.path.join(xlsx_directory, file)
-        try:
-            sheets = pd.read_excel(file_path, sheet_name=0)  # Read only the first sheet
-            sheets = convert_datetime_to_date(sheets)  # Convert datetime columns to date
-            # Check if "PulseNet Upload Date" column exists and filter non-empty rows
-            if 'PulseNet Upload Date' in sheets.columns:
-                sheets = sheets[sheets['PulseNet Upload Date'].notna() & (sheets['PulseNet Upload Date'] != '')]
-                
-                if not sheets.empty:  # Only proceed if there are valid rows
-                    sheet_name = extract_organism_name(file, run_date)  # Get the sheet name based on the organism
-                    combined_sheets[sheet_name] = pd.concat([combined_sheets.get(sheet_name, pd.DataFrame()), sheets], ignore_index=True)
-            else:
-                print(f"'PulseNet Upload Date' column not found in {file}. Skipping.")
-        except Exception as e:
-            print(f"Error processing {file}: {e}")
-
-    # Merge only recent CSV files based on run_date
-    csv_files = [file for file in os.listdir(csv_directory) if file.endswith('.csv') and run_date in file]
-    for file in csv_files:
-        file_path = os.path.join(csv_directory, file)
-        try:
-            df = pd.read_csv(file_path)
-            df = convert_datetime_to_date(df)  # Convert datetime columns to date
-            sheet_name = extract_organism_name(file, run_date) # To get the sheet name based on the organisms
-            combined_sheets[sheet_name] = pd.concat([combined_sheets.get(sheet_name, pd.DataFrame()), df], ignore_index=True)
-        except Exception as e:
-            print(f"Error processing {file}: {e}")
+    # The first sheet from Excel files, then only recent CSV files based on run_date
+    frames = {}
+    for _, sheet_name, df, _ in read_input_files(list_input_files(csv_directory, xlsx_directory, run_date), run_date, max_workers):
+        if df is not None:
+            frames.setdefault(sheet_name, []).append(df)
+
+    # Categoricals of different files only keep their type when their categories match, so the schema is applied again
+    return {sheet_name: apply_schema(pd.concat(dfs, ignore_index=True)) for sheet_name, dfs in frames.items()}
+
+
+def update_window_sheets(csv_directory, xlsx_directory, run_date, store_dir, max_workers=None):
+    """
+    Appends the input files that changed since the last run to the rolling window store and returns the records
+    of the last window_days days of uploads, see window_store. Unchanged workbooks are not read again, so a daily
+    run only reads that day's exports and the databases that were saved since. A workbook saved again replaces the
+    records stored from it, and the records of workbooks removed from the databases folder leave the store.
+    Falls back to merge_files_to_sheets when pyarrow is not installed.
+    
+    Parameters:
+        csv_directory (str): Path to the directory containing the .csv exports.
+        xlsx_directory (str): Path to the directory containing the .xlsx databases.
+        run_date (str): Date of the download in mmddyy format.
+        store_dir (str): Folder of the window store.
+        max_workers (int): Number of files read at the same time, defaults to the number of CPUs (at most 8).
     
+    Returns:
+        dict: A dictionary of DataFrames, each corresponding to a sheet.
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        print("pyarrow is not installed, reading every input file instead of the window store.")
+        return merge_files_to_sheets(csv_directory, xlsx_directory, run_date, max_workers)
+
+    os.makedirs(store_dir, exist_ok=True)
+    with file_lock(os.path.join(store_dir, store_lock)):
+        sources = load_sources(store_dir)
+        if not sources:
+            # Without the files appended, the records cannot be traced back to their files, so the store is rebuilt
+            clear_store(store_dir)
+        input_files = list_input_files(csv_directory, xlsx_directory, run_date)
+        states = {file_path: file_state(file_path) for file_path in input_files}
+        changed = [file_path for file_path in input_files if sources.get(file_path, {}).get("state") != states[file_path]]
+        removed = [file_path for file_path in sources if file_path not in states and file_source(file_path) == "database"]
+
+        frames = {}
+        for file_path, sheet_name, df, message in read_input_files(changed, run_date, max_workers):
+            # Files that could not be read are tried again on the next run, files without records still replace theirs
+            if df is not None or message is None:
+                frames.setdefault(sheet_name, []).append((file_path, df))
+                sources[file_path] = file_entry(states[file_path], sheet_name, df)
+
+        with stage("window append", rows_in=sum(len(df) for dfs in frames.values() for _, df in dfs if df is not None)) as record:
+            record["rows_out"] = sum(append_records(store_dir, sheet_name, dfs, run_date) for sheet_name, dfs in frames.items())
+            remove_files(store_dir, removed)
+            evict_partitions(store_dir, run_date)
+        # Keep the files still in the folders, the exports of earlier days are no longer listed
+        sources = {file_path: sources[file_path] for file_path in input_files if sources.get(file_path, {}).get("state") == states[file_path]}
+        save_sources(store_dir, sources)
+
+        with stage("window read") as record:
+            combined_sheets = {}
+            for sheet_name in list_organisms(store_dir):
+                df = read_window(store_dir, sheet_name, run_date, window_columns(sources, sheet_name))
+                if df is not None:
+                    combined_sheets[sheet_name] = df
+            record["rows_out"] = sum(len(df) for df in combined_sheets.values())
     return combined_sheets
 
 
@@ -87,6 +207,7 @@ def format_df(df):
     """
     Renames columns and rearranges them according to predefined headers,
     while excluding specified columns and including any extra columns specific to each DataFrame.
+    The headers and removed columns are declared in pulsenet_schema.
     
     Parameters:
         df (pd.DataFrame): The DataFrame to be formatted.
@@ -94,56 +215,6 @@ def format_df(df):
     Returns:
         pd.DataFrame: Formatted DataFrame with reordered columns.
     """
-    rename_col_lst = {
-        "Date Modified": "Modified date"
-    }
-    
-    # Columns to be removed
-    columns_to_remove = [
-        "TAT in Calendar Days",
-        "TAT in Workdays (minus weekends/Holidays)",
-        "Comment",
-        "SequencedDate",
-        "PulseNet Upload Date",
-        "PatientAgeYears",
-        "PatientAgeMonths",
-        "PatientAgeDays"
-    ]
-
-    # Define the CSV headers
-    csv_headers = [
-        "Key",
-        "Modified date",
-        "WGS_id",
-        "ReceivedDate",
-        "LabReceivedDate",
-        "SequencerRun_id",
-        "Allele_Code",
-        "Outbreak",
-        "REP_code",
-        "NCBI_ACCESSION",
-        "SRR_id",
-        "LastName",
-        "FirstName",
-        "SourceCounty",
-        "SourceState",
-        "PatientDOB",
-        "PATIENTAGEYEARS",
-        "PATIENTAGEMONTHS",
-        "PATIENTAGEDAYS",
-        "SourceSite",
-        "PatientSex",
-        "IsolatDate",
-        "SourceCountry",
-        "SourceType",
-        "PulseNet_UploadDate",
-        "Genus",
-        "Species",
-        "MLST_ST",
-        "LabID",
-        "OtherStateIsolate",
-    ]
-    
     # Rename columns based on the rename mapping
     df = df.rename(columns=rename_col_lst)
 
@@ -185,32 +256,33 @@ def process_df(df):
         return format_df(df)  # Format DataFrame before returning
 
     # Ensure 'Key' column is of object type to handle mixed types
-    df['Key'] = df['Key'].astype(object)
+    df = df.copy()
+    key = df['Key'].astype(object)
 
-    # Identify datatypes
-    df['type'] = df['Key'].apply(lambda x: type(x).__name__)
+    # Identify datatypes in a single pass over the keys
+    key_type = key.map(type)
+    is_int = key_type.isin([int, bool])
+    is_str = key_type == str
 
-    # Separate columns based on datatype
-    df['integers'] = df['Key'].apply(lambda x: x if isinstance(x, int) else None)
-    df['strings'] = df['Key'].apply(lambda x: x if isinstance(x, str) else None)
-    
-    # Convert 'integers' column to numeric, handling errors by coercing them to NaN
-    df['integers'] = pd.to_numeric(df['integers'], errors='coerce').astype('Int64')
+    # Separate columns based on datatype, converting 'integers' to numeric and coercing errors to NaN
+    df['integers'] = pd.to_numeric(key.where(is_int), errors='coerce').astype('Int64')
 
     # Ensure 'strings' column only contains non-numeric values
-    df['strings'] = df['strings'].apply(lambda x: x if isinstance(x, str) and not x.isnumeric() else None)
+    is_str &= ~key.where(is_str).str.isnumeric().fillna(False).astype(bool)
+    df['strings'] = key.where(is_str, None)
     
     # Extract numeric part from strings starting with 'KS'
-    df['numeric_part'] = df['strings'].apply(lambda x: ''.join(filter(str.isdigit, x)) if x and x.startswith('KS') else None)
+    starts_ks = df['strings'].str.startswith('KS', na=False)
+    df['numeric_part'] = df['strings'].where(starts_ks, None).str.replace(r'\D', '', regex=True)
     
     # Create new DataFrames for integers and strings
-    df_integers = df.dropna(subset=['integers']).drop(columns=['Key', 'type', 'strings', 'numeric_part'])
-    df_strings = df.dropna(subset=['strings']).drop(columns=['Key', 'type', 'integers', 'numeric_part'])
+    df_integers = df.dropna(subset=['integers']).drop(columns=['Key', 'strings', 'numeric_part'])
+    df_strings = df.dropna(subset=['strings']).drop(columns=['Key', 'integers', 'numeric_part'])
     
     # Create DataFrame with numeric parts starting with 'KS'
     df_numeric = df.dropna(subset=['numeric_part'])
     df_numeric['numeric_part'] = pd.to_numeric(df_numeric['numeric_part'], errors='coerce').astype('Int64')
-    df_numeric = df_numeric.drop(columns=['Key', 'type', 'integers', 'strings'])
+    df_numeric = df_numeric.drop(columns=['Key', 'integers', 'strings'])
 
     # Rename columns to avoid conflicts in merge
     df_integers.rename(columns={'integers': 'Key'}, inplace=True)
@@ -248,30 +320,112 @@ def process_df(df):
     return format_df(final_df)
 
 
-def save_combined_sheets(combined_sheets, output_file):
-    """Save combined DataFrames to an Excel file with multiple sheets."""
-    with pd.ExcelWriter(output_file) as writer:
-        for sheet_name, df in combined_sheets.items():
-            df = process_df(df)  # Process DataFrame before saving (This is necessary step)
-            df.to_excel(writer, sheet_name=sheet_name, index=False) # Convert the dataframe to excel file
+def columnar_path(output_file):
+    """Returns the folder holding the columnar copy of an Epi report, named like the report without the .xlsx extension."""
+    return os.path.splitext(output_file)[0]
+
+
+def to_columnar(df):
+    """
+    Prepares a processed DataFrame for Parquet. Key is stored as text, like the cluster finder uses it,
+    and object columns holding more than one kind of value (for example numbers and text) are stored as text.
+    
+    Parameters:
+        df (pd.DataFrame): The processed DataFrame.
+    
+    Returns:
+        pd.DataFrame: A copy with one type per column.
+    """
+    df = df.copy()
+    typed_kinds = {'string', 'date', 'datetime', 'datetime64', 'integer', 'floating', 'boolean', 'empty'}
+    for col in df.columns:
+        if col == 'Key' or (df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in typed_kinds):
+            df[col] = df[col].map(lambda x: str(x) if pd.notna(x) else None).astype(object)
+    return df
+
+
+def save_columnar_sheets(processed_sheets, output_dir):
+    """
+    Saves each processed DataFrame as one Parquet partition per organism (<output_dir>/<organism>.parquet).
+    Skipped with a message when pyarrow is not installed, the cluster finder then falls back to the Excel report.
+    
+    Parameters:
+        processed_sheets (dict): Processed DataFrames keyed by organism.
+        output_dir (str): Folder to write the partitions to.
+    
+    Returns:
+        str: The output folder, or None when nothing was written.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("pyarrow is not installed, skipping the columnar copy of the report.")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    for sheet_name, df in processed_sheets.items():
+        path = os.path.join(output_dir, f"{sheet_name}.parquet")
+        table = pa.Table.from_pandas(to_columnar(df), preserve_index=False)
+        with atomic_write(path, 'wb') as handle:
+            pq.write_table(table, handle)
+    return output_dir
+
+
+def process_combined_sheets(combined_sheets):
+    """Processes every combined DataFrame with process_df and returns them keyed by sheet name, with the compact schema types."""
+    processed_sheets = {}
+    for sheet_name, df in combined_sheets.items():
+        with stage("process_df", sheet_name, rows_in=len(df)) as record:
+            processed_sheets[sheet_name] = apply_schema(process_df(df))  # Process DataFrame before saving (This is necessary step)
+            record["rows_out"] = len(processed_sheets[sheet_name])
+    return processed_sheets
+
+
+def write_report(processed_sheets, output_file, columnar_dir=None):
+    """
+    Save processed DataFrames to an Excel file with multiple sheets, and to a columnar copy when columnar_dir is given.
+    Both are written to the local cache first and uploaded in the background, see share_cache.wait_for_uploads.
+    """
+    rows = sum(len(df) for df in processed_sheets.values())
+    with stage("write report", rows_in=rows, files_out=1):
+        local_file = staging_path(output_file)
+        # Dates are kept as datetime64 until here and written without a time
+        with pd.ExcelWriter(local_file, date_format='yyyy-mm-dd', datetime_format='yyyy-mm-dd') as writer:
+            for sheet_name, df in processed_sheets.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False) # Convert the dataframe to excel file
+        upload(local_file, output_file)
+    if columnar_dir:
+        with stage("write columnar", rows_in=rows, files_out=len(processed_sheets)):
+            local_dir = mirror_path(columnar_dir)
+            if save_columnar_sheets(processed_sheets, local_dir):
+                for sheet_name in processed_sheets:
+                    upload(os.path.join(local_dir, f"{sheet_name}.parquet"), os.path.join(columnar_dir, f"{sheet_name}.parquet"))
     return output_file  # Return the path to the saved file
 
 
+def save_combined_sheets(combined_sheets, output_file, columnar_dir=None):
+    """Save combined DataFrames to an Excel file with multiple sheets, and to a columnar copy when columnar_dir is given."""
+    return write_report(process_combined_sheets(combined_sheets), output_file, columnar_dir)
+
+
 if __name__ == "__main__":
     
     # Get the date from the user
     run_date = input("\nPlease enter the date of the download you made in mmddyy format\n--> ")
 
-    # Specify the paths to the directory
-    csv_directory = "//kdhe/dfs/LabShared/Molecular_Genomics_Unit/Testing/PulseNet/PulseNet 2.0/PNExports" 
-    xlsx_directory = "//kdhe/dfs/LabShared/Molecular_Genomics_Unit/Testing/PulseNet/PulseNet 2.0/WGS_Databases"
-    output_path = "//kdhe/dfs/EPI/LAB_OSE/WGS"
+    start_run("Epi_report_90Day", run_date, os.path.join(output_path, "run_logs"))
+    evict_share_cache()
 
-    # Combine all sheets from Excel and CSV files
-    combined_sheets = merge_files_to_sheets(csv_directory,xlsx_directory, run_date)
+    # Add the new records of the Excel and CSV files to the 90-day window and read it back
+    combined_sheets = update_window_sheets(csv_directory,xlsx_directory, run_date, os.path.join(output_path, store_folder))
     
     # Save the combined sheets to a new Excel file with the name including run_date
     output_file = os.path.join(output_path, f'{run_date} Epi report past 90.xlsx')
-    saved_file = save_combined_sheets(combined_sheets, output_file)
+    # The columnar copy is what the cluster finder reads, the Excel file is for people
+    saved_file = save_combined_sheets(combined_sheets, output_file, columnar_path(output_file))
+    with stage("upload"):
+        wait_for_uploads()
 
-print("The output was saved successfully!")
+    finish_run()
+    print("The output was saved successfully!")
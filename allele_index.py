@@ -0,0 +1,71 @@
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+
+
+# Allele code level used to split each organism's isolates into blocks before the SNP comparison, for example
+# {"Salmonella": 1}. Pairs across blocks are never compared, so this is only safe for organisms whose codes at
+# that level never separate isolates within the largest distance scanned: single-linkage chains can cross
+# allele code prefixes, and a dropped link changes the clusters, the neighbour graph and the Multi_Threshold sheet.
+# Blocks only apply to full scans, runs updating the previous clusters compare the new rows against every sample.
+# No organism is blocked by default, every organism is compared all-pairs.
+block_levels = {}
+
+
+def shared_prefix(codes):
+    """
+    Returns the longest prefix shared by every code, character by character.
+    The shared prefix of all codes is the shared prefix of the smallest and largest code, so this is O(total length).
+
+    Parameters:
+        codes (list): Allele codes as strings.
+
+    Returns:
+        str: The shared prefix, empty when there are no codes.
+    """
+    if not codes:
+        return ""
+    first, last = min(codes), max(codes)
+    ctr = 0
+    while ctr < len(first) and first[ctr] == last[ctr]:
+        ctr += 1
+    return first[:ctr]
+
+
+def code_prefixes(codes, level):
+    """
+    Cuts allele codes such as "SALM1.0 - 18.32.23.1.32.38.14" down to their scheme and first levels.
+
+    Parameters:
+        codes (pd.Series): Allele codes, missing values allowed.
+        level (int): Number of levels to keep.
+
+    Returns:
+        pd.Series: The prefixes, for example "SALM1.0 - 18" for level 1, missing for codes that are missing
+            or have fewer levels.
+    """
+    parts = codes.astype(object).where(codes.notna()).str.split(" - ", n=1)
+    scheme, levels = parts.str[0], parts.str[1].str.split(".")
+    has_levels = levels.str.len() >= level
+    prefixes = scheme + " - " + levels.str[:level].str.join(".")
+    return prefixes.where(has_levels & scheme.notna(), None)
+
+
+def prefix_blocks(codes, level):
+    """
+    Partitions the samples of a matrix into blocks of isolates sharing an allele code prefix.
+
+    Parameters:
+        codes (pd.Series): Allele code of every sample, in matrix order.
+        level (int): Allele code level the blocks are built on.
+
+    Returns:
+        tuple: A list of position arrays, one per prefix with at least two samples, and the positions of the
+            samples whose code is missing, which have to be compared against every sample.
+    """
+    prefixes = code_prefixes(pd.Series(list(codes)), level)
+    unknown = np.flatnonzero(prefixes.isna().to_numpy())
+    known = prefixes.dropna()
+    groups = known.groupby(known, sort=False).indices
+    blocks = [np.sort(known.index.to_numpy()[positions]) for positions in groups.values() if len(positions) >= 2]
+    return blocks, unknown
@@ -0,0 +1,118 @@
+# Import necessary libraries
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+# The pipeline scripts live in the folder above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Epi_report_90Day as epi_report
+import share_cache
+import cluster_finder_withEpiTrack as cluster_finder
+from cluster_engine import update_clusters
+from matrix_cache import load_cached_matrix
+from distance_matrix import DistanceMatrix
+from synthetic_data import write_run_inputs
+
+warnings.filterwarnings('ignore')
+
+run_date = "101826"
+next_run_date = "101926"
+default_sizes = [200, 1000, 5000]
+
+
+def time_stage(results, size, stage, func, *args, **kwargs):
+    """Runs one stage, appends its wall-clock time to results and returns what the stage returned."""
+    start = time.perf_counter()
+    output = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    results.append({"isolates": size, "stage": stage, "seconds": round(seconds, 4)})
+    print(f"{size:>8} {stage:<28} {seconds:10.3f}s")
+    return output
+
+
+def run_size(size, workdir, results, max_matrix_workbook):
+    """
+    Generates the synthetic inputs for one size and times every stage of both scripts on them.
+
+    Parameters:
+        size (int): Number of isolates.
+        workdir (str): Folder for the generated inputs and outputs.
+        results (list): Timings are appended to this list.
+        max_matrix_workbook (int): Largest size for which the matrix workbook is written and parsed.
+    """
+    write_matrix = size <= max_matrix_workbook
+    data = write_run_inputs(workdir, size, run_date, matrix_workbook=write_matrix)
+    paths = data["paths"]
+    # Keep the local copies of the inputs in the work folder instead of the user's cache
+    share_cache.default_cache_dir = os.path.join(workdir, "share_cache")
+
+    # Epi_report_90Day: the first run fills the window store from every input file, the next day only reads its export
+    store_dir = os.path.join(workdir, "window_store")
+    combined_sheets = time_stage(results, size, "window store (first run)", epi_report.update_window_sheets,
+                                 paths["csv_directory"], paths["xlsx_directory"], run_date, store_dir)
+    shutil.copy(paths["pn_export"], os.path.join(paths["csv_directory"], f"{next_run_date} PN Export Salmonella.csv"))
+    time_stage(results, size, "window store (next day)", epi_report.update_window_sheets,
+               paths["csv_directory"], paths["xlsx_directory"], next_run_date, store_dir)
+    processed = time_stage(results, size, "process_df", epi_report.process_df, combined_sheets["Salmonella"])
+    demo_df = processed.copy()
+    demo_df['Key'] = demo_df['Key'].astype(str)
+    demo_df = demo_df.set_index('Key')
+
+    # Matrix load, straight from the workbook and then through the cache (a miss that fills it and a hit)
+    if write_matrix:
+        matrix_df = time_stage(results, size, "matrix load (read_matrix)", cluster_finder.read_matrix, paths["matrix"])
+        cache_dir = os.path.join(workdir, "matrix_cache")
+        time_stage(results, size, "matrix load (cache miss)", load_cached_matrix, paths["matrix"], cluster_finder.read_matrix, cache_dir)
+        matrix_df = time_stage(results, size, "matrix load (cache hit)", load_cached_matrix, paths["matrix"], cluster_finder.read_matrix, cache_dir)
+    else:
+        matrix_df = data["matrix"]
+        matrix_df.index = [cluster_finder.extract_numeric_part(x) for x in matrix_df.index]
+        matrix_df.columns = list(matrix_df.index)
+        matrix_df = time_stage(results, size, "matrix condense", DistanceMatrix.from_frame, matrix_df)
+
+    # Cluster detection, on the whole matrix and then with 2% of the isolates new since the previous run
+    clusters, _ = time_stage(results, size, "cluster detection (full)", update_clusters, matrix_df, 5)
+    known = matrix_df.take(range(int(size * 0.98)))
+    _, state = update_clusters(known, 5)
+    time_stage(results, size, "cluster detection (2% new)", update_clusters, matrix_df, 5, state)
+
+    cluster_matrices = {f"cluster_{i}": matrix_df.take(idx) for i, idx in enumerate(clusters)}
+    summaries = time_stage(results, size, "summary building", cluster_finder.build_summaries,
+                           cluster_matrices, demo_df, cluster_finder.get_col_order("Salmonella"))
+
+    flags = time_stage(results, size, "flag classification", cluster_finder.organism_flags,
+                       demo_df, "Salmonella", cluster_finder.flag_rules)
+
+    samples = [s for m in cluster_matrices.values() for s in m.index if s in demo_df.index]
+    time_stage(results, size, "workbook writing", cluster_finder.write_cluster_workbook,
+               os.path.join(workdir, f"{run_date} Salmonella clusters.xlsx"), cluster_matrices, summaries,
+               demo_df.loc[samples], flags, samples[:10])
+
+    results_dir = workdir + "/"
+    os.makedirs(os.path.join(workdir, "Epi_Track_Output", "Salmonella"), exist_ok=True)
+    time_stage(results, size, "Epi Track export", cluster_finder.format_df_sal, results_dir, demo_df.reset_index(), run_date)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every stage of the PulseNet scripts on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="Numbers of isolates to benchmark (200 to 20000).")
+    parser.add_argument("--max-matrix-workbook", type=int, default=2000,
+                        help="Largest size for which the matrix is written to and parsed from a workbook.")
+    parser.add_argument("--output", help="Write the timings to this JSON file.")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'isolates':>8} {'stage':<28} {'time':>11}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            run_size(size, workdir, results, args.max_matrix_workbook)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
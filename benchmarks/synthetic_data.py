@@ -0,0 +1,196 @@
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+import os
+from datetime import date
+
+
+# Fake values used to fill the demographic columns
+last_names = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Martinez", "Wilson"]
+first_names = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth"]
+counties = ["Sedgwick", "Johnson", "Shawnee", "Wyandotte", "Douglas", "Riley", "Butler", "Reno", "Saline", "Finney"]
+sites = ["Stool", "Blood", "Urine", "Wound", "CSF"]
+serotypes = ["Enteritidis", "Typhimurium", "Newport", "Javiana", "Infantis", "Typhi", "Paratyphi A", "Paratyphi B"]
+toxins = ["stx1", "stx2", "stx1,stx2", "eae,stx2"]
+
+
+def make_isolates(n, run_date, seed=0, cluster_fraction=0.3, max_cluster_size=10):
+    """
+    Builds n synthetic isolates. About cluster_fraction of them are planted in clusters of 2 to max_cluster_size
+    isolates, which share an allele code and later get small SNP distances to each other.
+
+    Parameters:
+        n (int): Number of isolates.
+        run_date (str): Date of the run in mmddyy format, upload dates are spread over the 90 days before it.
+        seed (int): Seed of the random generator.
+        cluster_fraction (float): Share of the isolates that belong to a planted cluster.
+        max_cluster_size (int): Largest planted cluster.
+
+    Returns:
+        pd.DataFrame: One row per isolate with its HSN, planted cluster id (-1 for none) and demographics.
+    """
+    rng = np.random.default_rng(seed)
+    hsn = 24000000 + rng.choice(900000, size=n, replace=False)
+
+    # Plant the clusters
+    cluster_id = np.full(n, -1)
+    position, cluster = 0, 0
+    clustered = rng.permutation(n)[:int(n * cluster_fraction)]
+    while position < len(clustered) - 1:
+        size = int(rng.integers(2, max_cluster_size + 1))
+        cluster_id[clustered[position:position + size]] = cluster
+        position += size
+        cluster += 1
+
+    # Clustered isolates share the allele code of their cluster, the others get their own
+    code_parts = rng.integers(1, 50, size=(n, 7))
+    has_cluster = cluster_id >= 0
+    code_parts[has_cluster] = rng.integers(1, 50, size=(cluster + 1, 7))[cluster_id[has_cluster]]
+    allele_code = ["SALM1.0 - " + ".".join(str(p) for p in parts) for parts in code_parts]
+
+    end = pd.Timestamp(date(2000 + int(run_date[4:]), int(run_date[:2]), int(run_date[2:4])))
+    upload = end - pd.to_timedelta(rng.integers(0, 90, size=n), unit='D')
+    dob = pd.Timestamp("1940-01-01") + pd.to_timedelta(rng.integers(0, 80 * 365, size=n), unit='D')
+
+    isolates = pd.DataFrame({
+        "HSN": hsn,
+        "Cluster": cluster_id,
+        "Allele_Code": allele_code,
+        "WGS_id": [f"KS-WGS-{h}" for h in hsn],
+        "LastName": rng.choice(last_names, size=n),
+        "FirstName": rng.choice(first_names, size=n),
+        "SourceCounty": rng.choice(counties, size=n),
+        "SourceState": "KS",
+        "PatientDOB": dob,
+        "PATIENTAGEYEARS": ((upload - dob).days // 365).astype(int),
+        "SourceSite": rng.choice(sites, size=n),
+        "PatientSex": rng.choice(["M", "F"], size=n),
+        "IsolatDate": upload - pd.Timedelta(days=7),
+        "ReceivedDate": upload - pd.Timedelta(days=5),
+        "PulseNet_UploadDate": upload,
+        "Serotype_wgs": rng.choice(serotypes, size=n),
+        "Toxin_wgs": rng.choice(toxins, size=n),
+        "LabID": np.where(rng.random(n) < 0.9, "KS", "MO"),
+    })
+    # A few planted clusters are already tracked as outbreaks
+    outbreak = np.where((cluster_id >= 0) & (cluster_id % 5 == 0), "2401KSJGX-" + cluster_id.astype(str), None)
+    isolates["Outbreak"] = outbreak
+    return isolates
+
+
+def write_wgs_database(isolates, path, seed=0):
+    """
+    Writes a WGS_Databases workbook. Most keys are the integer HSN, about one in ten is written as a KS___ string,
+    and a few rows have no "PulseNet Upload Date".
+    """
+    rng = np.random.default_rng(seed)
+    key = isolates["HSN"].astype(object)
+    as_string = rng.random(len(isolates)) < 0.1
+    key[as_string] = ["KS___" + str(h) for h in isolates["HSN"][as_string]]
+    upload = isolates["PulseNet_UploadDate"].where(rng.random(len(isolates)) > 0.02)
+
+    df = pd.DataFrame({
+        "Key": key,
+        "Date Modified": isolates["PulseNet_UploadDate"],
+        "LastName": isolates["LastName"],
+        "FirstName": isolates["FirstName"],
+        "PatientDOB": isolates["PatientDOB"],
+        "PATIENTAGEYEARS": isolates["PATIENTAGEYEARS"],
+        "SourceCounty": isolates["SourceCounty"],
+        "SourceState": isolates["SourceState"],
+        "PatientSex": isolates["PatientSex"],
+        "SourceSite": isolates["SourceSite"],
+        "IsolatDate": isolates["IsolatDate"],
+        "ReceivedDate": isolates["ReceivedDate"],
+        "TAT in Calendar Days": 7,
+        "Comment": "",
+        "PulseNet Upload Date": upload,
+    })
+    df.to_excel(path, index=False)
+    return path
+
+
+def write_pn_export(isolates, path):
+    """Writes a PN Export CSV, keyed by KS___ strings and holding the sequencing fields of every isolate."""
+    df = pd.DataFrame({
+        "Key": ["KS___" + str(h) for h in isolates["HSN"]],
+        "Date Modified": isolates["PulseNet_UploadDate"].dt.strftime("%Y-%m-%d"),
+        "WGS_id": isolates["WGS_id"],
+        "Allele_Code": isolates["Allele_Code"],
+        "Outbreak": isolates["Outbreak"],
+        "REP_code": "",
+        "NCBI_ACCESSION": ["SAMN" + str(h) for h in isolates["HSN"]],
+        "SourceState": isolates["SourceState"],
+        "PulseNet_UploadDate": isolates["PulseNet_UploadDate"].dt.strftime("%Y-%m-%d"),
+        "Genus": "Salmonella",
+        "Species": "enterica",
+        "LabID": isolates["LabID"],
+        "Serotype_wgs": isolates["Serotype_wgs"],
+        "Toxin_wgs": isolates["Toxin_wgs"],
+        "Escherichia_group": "",
+    })
+    df.to_csv(path, index=False)
+    return path
+
+
+def make_snp_matrix(isolates, cutoff=5, seed=0):
+    """
+    Builds a symmetric SNP distance matrix with the planted clusters: isolates of the same cluster are at most
+    cutoff SNPs apart and every other pair is 30 to 500 SNPs apart.
+
+    Parameters:
+        isolates (pd.DataFrame): Isolates returned by make_isolates.
+        cutoff (int): Largest distance inside a planted cluster.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        pd.DataFrame: The matrix, with KS___ sample labels on both axes.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(isolates)
+    cluster_id = isolates["Cluster"].to_numpy()
+    values = rng.integers(30, 500, size=(n, n), dtype=np.uint16)
+    same = (cluster_id[:, None] == cluster_id[None, :]) & (cluster_id[:, None] >= 0)
+    values[same] = rng.integers(0, cutoff + 1, size=int(same.sum()), dtype=np.uint16)
+    values = np.triu(values, 1)
+    values += values.T
+    labels = ["KS___" + str(h) for h in isolates["HSN"]]
+    return pd.DataFrame(values, index=labels, columns=labels)
+
+
+def write_matrix_workbook(matrix_df, path):
+    """Writes a matrix workbook laid out like the ones the cluster finder reads, with the labels in a 'samples' column."""
+    matrix_df.rename_axis("samples").reset_index().to_excel(path, index=False)
+    return path
+
+
+def write_run_inputs(directory, n, run_date, seed=0, matrix_workbook=True):
+    """
+    Writes every input of a run for n Salmonella isolates: a WGS_Databases workbook, a PN export and a matrix workbook.
+
+    Parameters:
+        directory (str): Folder to create the PNExports, WGS_Databases and matrix files in.
+        n (int): Number of isolates.
+        run_date (str): Date of the run in mmddyy format.
+        seed (int): Seed of the random generators.
+        matrix_workbook (bool): Also write the matrix as a workbook, which is slow for large n.
+
+    Returns:
+        dict: The isolates, the matrix and the paths that were written.
+    """
+    csv_directory = os.path.join(directory, "PNExports")
+    xlsx_directory = os.path.join(directory, "WGS_Databases")
+    os.makedirs(csv_directory, exist_ok=True)
+    os.makedirs(xlsx_directory, exist_ok=True)
+
+    isolates = make_isolates(n, run_date, seed)
+    matrix_df = make_snp_matrix(isolates, seed=seed)
+    paths = {
+        "csv_directory": csv_directory,
+        "xlsx_directory": xlsx_directory,
+        "wgs_database": write_wgs_database(isolates, os.path.join(xlsx_directory, "Salmonella Metadata Link BaseSpace.xlsx"), seed),
+        "pn_export": write_pn_export(isolates, os.path.join(csv_directory, f"{run_date} PN Export Salmonella.csv")),
+    }
+    if matrix_workbook:
+        paths["matrix"] = write_matrix_workbook(matrix_df, os.path.join(directory, f"{run_date} matrix Salmonella.xlsx"))
+    return {"isolates": isolates, "matrix": matrix_df, "paths": paths}
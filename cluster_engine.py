@@ -0,0 +1,333 @@
+# Import necessary libraries
+import numpy as np
+import json
+from distance_matrix import DistanceMatrix
+from file_utils import atomic_write
+
+
+# Number of matrix rows thresholded at once, keeps the boolean mask small on large matrices
+chunk_rows = 1024
+
+
+def threshold_pairs(values, cutoff, rows=None):
+    """
+    Finds every pair of samples whose SNP distance is at or below the cutoff.
+
+    Parameters:
+        values (np.ndarray): Square, symmetric SNP distance matrix.
+        cutoff (int): Maximum SNP distance for two samples to be linked.
+        rows (array-like): Optional row positions to examine. When given, each row is compared against every column,
+            otherwise only the upper triangle of the whole matrix is examined.
+
+    Returns:
+        tuple: Three arrays (i, j, distance) with i < j for every linked pair.
+    """
+    values = np.asarray(values, dtype=float)
+    n = values.shape[0]
+    pair_i, pair_j = [], []
+
+    if rows is None:
+        for start in range(0, n, chunk_rows):
+            stop = min(start + chunk_rows, n)
+            block = values[start:stop, :]
+            # Only look above the diagonal, the matrix is symmetric
+            mask = block <= cutoff
+            mask &= np.arange(n)[None, :] > np.arange(start, stop)[:, None]
+            bi, bj = np.nonzero(mask)
+            pair_i.append(bi + start)
+            pair_j.append(bj)
+    else:
+        rows = np.asarray(rows, dtype=np.intp)
+        for start in range(0, len(rows), chunk_rows):
+            chunk = rows[start:start + chunk_rows]
+            bi, bj = _row_pairs(values[chunk, :], chunk, cutoff)
+            pair_i.append(bi)
+            pair_j.append(bj)
+
+    if not pair_i:
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty, np.empty(0, dtype=float)
+
+    pair_i = np.concatenate(pair_i)
+    pair_j = np.concatenate(pair_j)
+    if rows is not None:
+        pair_i, pair_j, _ = _unique_pairs(pair_i, pair_j)
+    return pair_i, pair_j, values[pair_i, pair_j]
+
+
+def _row_pairs(block, rows, cutoff):
+    # Pairs within the cutoff between the given rows and every column, ignoring each row's own diagonal cell
+    mask = block <= cutoff
+    mask[np.arange(len(rows)), rows] = False
+    bi, bj = np.nonzero(mask)
+    return rows[bi], bj
+
+
+def _unique_pairs(pair_i, pair_j):
+    # Store every pair once with the smaller position first, also returns where each kept pair came from
+    lo = np.minimum(pair_i, pair_j)
+    hi = np.maximum(pair_i, pair_j)
+    if not len(lo):
+        return lo, hi, np.empty(0, dtype=np.intp)
+    _, keep = np.unique(np.stack([lo, hi], axis=1), axis=0, return_index=True)
+    return lo[keep], hi[keep], keep
+
+
+def _matrix_rows(matrix, rows):
+    # Full rows of the given positions, from a DistanceMatrix or a square DataFrame
+    if isinstance(matrix, DistanceMatrix):
+        return matrix.rows(rows)
+    return matrix.iloc[rows].to_numpy(dtype=float)
+
+
+def _scan_rows(matrix, rows, cutoff):
+    # Pairs within the cutoff between the given sorted rows and every column, pairs between two of the rows appear twice
+    pair_i, pair_j, distances = [np.empty(0, dtype=np.intp)], [np.empty(0, dtype=np.intp)], [np.empty(0, dtype=float)]
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        block = _matrix_rows(matrix, chunk)
+        bi, bj = _row_pairs(block, chunk, cutoff)
+        distances.append(block[np.searchsorted(chunk, bi), bj].astype(float))
+        pair_i.append(bi)
+        pair_j.append(bj)
+    return np.concatenate(pair_i), np.concatenate(pair_j), np.concatenate(distances)
+
+
+def matrix_pairs(matrix, cutoff, blocks=None):
+    """
+    Finds every pair of samples within the cutoff in a DistanceMatrix or a square DataFrame.
+    With blocks, only pairs inside a block are examined, plus every pair of the samples left out of the blocks.
+
+    Parameters:
+        matrix (DistanceMatrix or pd.DataFrame): SNP distance matrix indexed by sample.
+        cutoff (int): Maximum SNP distance for two samples to be linked.
+        blocks (tuple): Optional sorted position arrays of the blocks, and the positions compared against
+            every sample, as returned by allele_index.prefix_blocks.
+
+    Returns:
+        tuple: Three arrays (i, j, distance) with i < j for every linked pair.
+    """
+    if blocks is None:
+        if isinstance(matrix, DistanceMatrix):
+            return matrix.threshold_pairs(cutoff)
+        return threshold_pairs(matrix.to_numpy(dtype=float), cutoff)
+
+    block_lst, unblocked = blocks
+    pair_i, pair_j, distances = _scan_rows(matrix, np.sort(np.asarray(unblocked, dtype=np.intp)), cutoff)
+    pair_i, pair_j, distances = [pair_i], [pair_j], [distances]
+    for block in block_lst:
+        block = np.asarray(block, dtype=np.intp)
+        if isinstance(matrix, DistanceMatrix) and len(block) > chunk_rows:
+            bi, bj, bd = matrix.take(block).threshold_pairs(cutoff)
+        elif isinstance(matrix, DistanceMatrix):
+            bi, bj, bd = threshold_pairs(matrix.block(block), cutoff)
+        else:
+            bi, bj, bd = threshold_pairs(matrix.iloc[block, block].to_numpy(dtype=float), cutoff)
+        pair_i.append(block[bi])
+        pair_j.append(block[bj])
+        distances.append(bd)
+    pair_i, pair_j, keep = _unique_pairs(np.concatenate(pair_i), np.concatenate(pair_j))
+    return pair_i, pair_j, np.concatenate(distances)[keep]
+
+
+def connected_components(n, pair_i, pair_j, min_size=2):
+    """
+    Groups samples into single-linkage clusters using a vectorized union-find (hook and compress).
+
+    Parameters:
+        n (int): Number of samples in the matrix.
+        pair_i (np.ndarray): First position of every linked pair.
+        pair_j (np.ndarray): Second position of every linked pair.
+        min_size (int): Smallest cluster size to return.
+
+    Returns:
+        list: One sorted array of matrix positions per cluster, ordered by the first position in each cluster.
+    """
+    return _groups(_component_roots(np.arange(n), pair_i, pair_j), min_size)
+
+
+def _component_roots(parent, pair_i, pair_j):
+    # Links the pairs into the forest given by parent (every sample pointing straight at its root) and returns the new one
+    parent = parent.copy()
+    pair_i = np.asarray(pair_i, dtype=np.intp)
+    pair_j = np.asarray(pair_j, dtype=np.intp)
+
+    while len(pair_i):
+        root_i, root_j = parent[pair_i], parent[pair_j]
+        if np.array_equal(root_i, root_j):
+            break
+        # Hook the larger root under the smaller one so pointers always go down and never form a cycle
+        np.minimum.at(parent, np.maximum(root_i, root_j), np.minimum(root_i, root_j))
+        # Compress every path so each sample points straight at its root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    return parent
+
+
+def _groups(parent, min_size):
+    # The root is the smallest position in its cluster, so sorting by root keeps the matrix order
+    order = np.argsort(parent, kind='stable')
+    groups = np.split(order, np.flatnonzero(np.diff(parent[order])) + 1)
+    return [group for group in groups if len(group) >= min_size]
+
+
+def single_linkage_levels(n, pair_i, pair_j, distances):
+    """
+    Builds the single-linkage hierarchy of a set of links: the clusters after merging every link up to each
+    distinct distance, smallest first. Clusters at any threshold up to the largest link are then read off
+    with clusters_at, without looking at the matrix again.
+
+    Parameters:
+        n (int): Number of samples in the matrix.
+        pair_i (np.ndarray): First position of every linked pair.
+        pair_j (np.ndarray): Second position of every linked pair.
+        distances (np.ndarray): SNP distance of every linked pair.
+
+    Returns:
+        tuple: The distinct distances in ascending order, and an array with, for each of them,
+            the root position of every sample's cluster.
+    """
+    distances = np.asarray(distances)
+    levels = np.unique(distances)
+    roots = np.empty((len(levels), n), dtype=np.intp)
+    parent = np.arange(n)
+    for k, level in enumerate(levels):
+        linked = distances == level
+        parent = _component_roots(parent, np.asarray(pair_i)[linked], np.asarray(pair_j)[linked])
+        roots[k] = parent
+    return levels, roots
+
+
+def roots_at(levels, roots, threshold):
+    """Returns the root position of every sample's cluster at a threshold, from single_linkage_levels."""
+    k = np.searchsorted(levels, threshold, side='right') - 1
+    if k < 0:
+        return np.arange(roots.shape[1])
+    return roots[k]
+
+
+def clusters_at(levels, roots, threshold, min_size=2):
+    """
+    Reads the single-linkage clusters at a threshold off the hierarchy built by single_linkage_levels.
+
+    Parameters:
+        levels (np.ndarray): Distinct distances of the hierarchy.
+        roots (np.ndarray): Root positions of the hierarchy.
+        threshold (int): Maximum SNP distance for two samples to be linked, at most the largest distance the links were collected for.
+        min_size (int): Smallest cluster size to return.
+
+    Returns:
+        list: One sorted array of matrix positions per cluster, ordered by the first position in each cluster.
+    """
+    return _groups(roots_at(levels, roots, threshold), min_size)
+
+
+def find_clusters(matrix_df, cutoff, min_size=2):
+    """
+    Finds single-linkage clusters in a SNP matrix.
+
+    Parameters:
+        matrix_df (DistanceMatrix or pd.DataFrame): SNP distance matrix indexed by sample.
+        cutoff (int): Maximum SNP distance for two samples to be linked.
+        min_size (int): Smallest cluster size to return.
+
+    Returns:
+        list: One array of matrix positions per cluster.
+    """
+    pair_i, pair_j, _ = matrix_pairs(matrix_df, cutoff)
+    return connected_components(len(matrix_df), pair_i, pair_j, min_size)
+
+
+def load_cluster_state(path):
+    """
+    Reads the cluster state saved by the previous run.
+
+    Parameters:
+        path (str): Path to the cluster tracker JSON file.
+
+    Returns:
+        dict: Saved state per organism, empty when there is no readable tracker.
+    """
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cluster_state(state, path):
+    """Writes the cluster state for the next run, replacing the tracker only once the new file is complete."""
+    with atomic_write(path) as handle:
+        json.dump(state, handle)
+
+
+def update_links(matrix_df, max_distance, previous=None, blocks=None):
+    """
+    Finds every pair of samples within max_distance, reusing the links saved by the previous run when possible.
+    Only the rows of samples added since the previous run are compared, and their links are merged
+    with the saved ones. The whole matrix is examined when there is no usable previous state,
+    when max_distance changed or when samples were removed from the matrix, and that scan can be
+    limited to allele code blocks.
+
+    Parameters:
+        matrix_df (DistanceMatrix or pd.DataFrame): SNP distance matrix indexed by sample.
+        max_distance (int): Largest SNP distance kept.
+        previous (dict): State of this organism saved by the previous run.
+        blocks (tuple): Optional blocks of samples for the whole matrix scan, as returned by allele_index.prefix_blocks.
+
+    Returns:
+        tuple: Three arrays (i, j, distance) with i < j for every linked pair, and the state to save for the next run.
+    """
+    labels = [str(x) for x in matrix_df.index]
+    positions = {label: i for i, label in enumerate(labels)}
+
+    if previous and previous.get('cutoff') == max_distance and all(s in positions for s in previous.get('samples', [])):
+        known = set(previous['samples'])
+        new_rows = np.array([i for i, label in enumerate(labels) if label not in known], dtype=np.intp)
+        print(f"Updating clusters with {len(new_rows)} new samples")
+
+        old_edges = previous.get('edges', [])
+        old_i = np.array([positions[a] for a, _, _ in old_edges], dtype=np.intp)
+        old_j = np.array([positions[b] for _, b, _ in old_edges], dtype=np.intp)
+        old_d = np.array([d for _, _, d in old_edges], dtype=float)
+
+        new_i, new_j, new_d = _scan_rows(matrix_df, new_rows, max_distance)
+
+        pair_i = np.concatenate([old_i, new_i])
+        pair_j = np.concatenate([old_j, new_j])
+        distances = np.concatenate([old_d, new_d])
+        # Links between two new samples were found from both rows, keep one of each
+        pair_i, pair_j, keep = _unique_pairs(pair_i, pair_j)
+        distances = distances[keep]
+    else:
+        pair_i, pair_j, distances = matrix_pairs(matrix_df, max_distance, blocks)
+
+    state = {
+        'cutoff': max_distance,
+        'samples': labels,
+        'edges': [[labels[i], labels[j], float(d)] for i, j, d in zip(pair_i, pair_j, distances)],
+    }
+    return pair_i, pair_j, distances, state
+
+
+def update_clusters(matrix_df, cutoff, previous=None, min_size=2, blocks=None):
+    """
+    Finds single-linkage clusters, reusing the threshold graph of the previous run when possible, see update_links.
+
+    Parameters:
+        matrix_df (DistanceMatrix or pd.DataFrame): SNP distance matrix indexed by sample.
+        cutoff (int): Maximum SNP distance for two samples to be linked.
+        previous (dict): State of this organism saved by the previous run.
+        min_size (int): Smallest cluster size to return.
+        blocks (tuple): Optional blocks of samples for the whole matrix scan, as returned by allele_index.prefix_blocks.
+
+    Returns:
+        tuple: The clusters as arrays of matrix positions, and the state to save for the next run.
+    """
+    pair_i, pair_j, _, state = update_links(matrix_df, cutoff, previous, blocks)
+    clusters = connected_components(len(state['samples']), pair_i, pair_j, min_size)
+    state['clusters'] = [[state['samples'][i] for i in cluster] for cluster in clusters]
+    return clusters, state
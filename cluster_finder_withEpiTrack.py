@@ -1,185 +1,249 @@
 # Import necessary libraries
 import pandas as pd
-import openpyxl
-from openpyxl.styles import Font, Color, colors, fills
+import numpy as np
+from openpyxl.styles import PatternFill
+from openpyxl.formatting.rule import ColorScaleRule
+from openpyxl.utils import get_column_letter
 import os
 from os import walk
-import win32com.client
-import time
-from win32com.client import constants
 from datetime import datetime
 import warnings
-from datetime import date
+import json
+from file_utils import atomic_write
+from cluster_engine import update_links, load_cluster_state, save_cluster_state, single_linkage_levels, clusters_at, roots_at
+from matrix_cache import load_cached_matrix, evict_cache
+from distance_matrix import DistanceMatrix
+from matrix_reader import read_matrix_workbook
+from allele_index import block_levels, shared_prefix, prefix_blocks
+from neighbour_graph import neighbour_distance, NeighbourGraph, save_neighbour_graph, graph_path
+from hsn_history import keep_new_hsns
+from pulsenet_schema import apply_schema
+from flag_rules import load_flag_rules, organism_flags
+from share_cache import share_path, mirror_path, prefetch, staging_path, upload, wait_for_uploads, evict_share_cache
+from run_metrics import start_run, stage, finish_run, worker_settings, run_in_worker, add_stages
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 # Suppresses all warnings
 warnings.filterwarnings('ignore')
 
 organisms = ["Campylobacter","Escherichia", "Listeria" ,"Salmonella", "Vibrio"] 
-path_to_downloads = "//kdhe/dfs/LabShared/Molecular Genomics Unit/Testing/PulseNet/Downloaded data/"
-path_to_epi_report = "//kdhe/dfs/EPI/LAB_OSE/WGS/"      
+# Folders on the share, see share_cache.share_path to point them at another root
+path_to_downloads = share_path("//kdhe/dfs/LabShared/Molecular Genomics Unit/Testing/PulseNet/Downloaded data/")
+path_to_epi_report = share_path("//kdhe/dfs/EPI/LAB_OSE/WGS/")
 json_path = "cluster_tracker.json"
-path_to_results = "//kdhe/dfs/epi/lab_ose/wgs/script_results/"    
+manifest_name = "report_manifest.json"
+path_to_results = share_path("//kdhe/dfs/epi/lab_ose/wgs/script_results/")
 
 
+# SNP cutoff of the reported clusters, organisms not listed in organism_cutoffs use cutoff
 cutoff = 10
+organism_cutoffs = {"Salmonella": 5}
+# Thresholds of the Multi_Threshold sheet, all read off one single-linkage hierarchy per organism
+summary_thresholds = [5, 10, 15]
+
+# Flag tables of the cluster workbooks, read from flag_rules.json
+flag_rules = load_flag_rules()
+
+# Number of organisms analysed at the same time, each in its own worker process.
+# 1 analyses them one after another in this process, None uses one worker per organism up to the number of CPUs.
+organism_workers = None
+
+# Columns of the summary tables, PatientDOB is only reported for the organisms in dob_organisms
+summary_col_order = ['Sample ID', 'LastName', 'FirstName', 'PatientDOB', 'SourceCounty', 'PATIENTAGEYEARS', 'PatientSex', 'SourceSite','PulseNet_UploadDate','Outbreak']
+dob_organisms = ['Salmonella', 'Escherichia']
+
+# Function to get the summary columns of the given organism
+def get_col_order(organism):
+    return [col for col in summary_col_order if col != 'PatientDOB' or organism in dob_organisms]
+
+# This function builds the summary table of every cluster of an organism with a single lookup into the demographics,
+# each table is indexed by the samples of the cluster and the index is named after the cluster's aa code.
+def build_summaries(cluster_matrices, demo_df, col_order):
+    cluster_samples = [list(matrix.index) for matrix in cluster_matrices.values()]
+    all_samples = [sample for samples in cluster_samples for sample in samples]
+
+    demo_df = demo_df[~demo_df.index.duplicated(keep='first')]
+    info = summary_columns(demo_df.reindex(index=all_samples), col_order)
+
+    # Split the joined table back into one summary per cluster
+    summary_lst = []
+    start = 0
+    for aa_code, samples in zip(cluster_matrices.keys(), cluster_samples):
+        summary_matrix = info.iloc[start:start + len(samples)]
+        summary_matrix.index = pd.Index(samples, name=aa_code)
+        summary_lst.append(summary_matrix)
+        start += len(samples)
+    return summary_lst
+
+# This function selects the summary columns by name, with the date of birth shown without a time
+def summary_columns(df, col_order):
+    info = df.reindex(columns=col_order[1:])
+    if 'PatientDOB' in info.columns:
+        info['PatientDOB'] = pd.to_datetime(info['PatientDOB'], errors='coerce').dt.date
+    return info
+
+# This function builds the outbreak summaries with a single lookup: one table per outbreak code, in order of first appearance,
+# holding every isolate of that outbreak with the same columns as the cluster summaries and the index named after the outbreak code.
+def build_outbreak_summaries(df_of_outbreaks, col_order):
+    info = summary_columns(df_of_outbreaks, col_order)
+    codes = df_of_outbreaks['Outbreak'].astype(str).to_numpy()
+    return [summary.rename_axis(outbreak_code) for outbreak_code, summary in info.groupby(codes, sort=False)]
+
+# This function builds the Multi_Threshold sheet: every sample clustered at one of the thresholds, with the name of its
+# cluster at the organism's cutoff and the number of its cluster at every threshold, read off the single-linkage hierarchy.
+# Samples of the same cluster at the largest threshold are listed together, grouped by their clusters at the smaller ones.
+def build_threshold_summary(labels, levels, roots, thresholds, cluster_names):
+    thresholds = sorted(thresholds)
+    columns = {}
+    for threshold in thresholds:
+        member = np.full(len(labels), '', dtype=object)
+        for number, group in enumerate(clusters_at(levels, roots, threshold), start=1):
+            member[group] = f"{threshold}-{number}"
+        columns[f"{threshold} SNPs"] = member
+    threshold_df = pd.DataFrame(columns, index=pd.Index([str(label) for label in labels], name='Sample ID'))
+    threshold_df.insert(0, 'Cluster', [cluster_names.get(label, '') for label in threshold_df.index])
+
+    order = np.lexsort([roots_at(levels, roots, threshold) for threshold in thresholds])
+    clustered = (threshold_df.iloc[:, 1:] != '').any(axis=1).to_numpy()
+    return threshold_df.iloc[order[clustered[order]]]
 
-# Function to extract the date column from the given patient DOB and Sample ID
-def get_attr(row, attr, df):
-    if attr == 'PatientDOB':
-        date = df.loc[row['Sample ID'], attr]
-        print(date)
-        return date.date()
-    else:
-        return df.loc[row['Sample ID'], attr]
-
-        
 # Function to extract numeric part from column names
 def extract_numeric_part(col_name):
     if 'KS___' in col_name:
         return col_name.split('KS___')[-1]  # Get the part after 'KS___'
     return col_name
 
-# This function shades/colored the sheets values based on the lowest and highest value.
-def shade_workbooks(path_lst):
-    print("\nColoring workbooks...")
-    xl = win32com.client.gencache.EnsureDispatch("Excel.Application")
-    xl.ScreenUpdating = False
+# Function to read a matrix workbook into a condensed matrix labelled with the cleaned HSN of every sample,
+# the row labels are checked against the column labels while the sheet is streamed
+def read_matrix(path_matrix):
+    return read_matrix_workbook(path_matrix, extract_numeric_part)
 
-    for path in path_lst:
+# Function to read the demographics of an organism, from the columnar copy of the Epi report when it exists
+# and from the Epi report workbook otherwise.
+def read_demo_sheet(demo_path, organism):
+    columnar_file = os.path.join(os.path.splitext(demo_path)[0], organism + ".parquet")
+    if os.path.exists(columnar_file):
         try:
-            workbook = xl.Workbooks.Open(path)
-
-            for sheet in workbook.Sheets:
-                if sheet.Name not in ['Summary', 'Summary_Demographics']:
-                    xl.Worksheets(sheet.Name).Activate()
-                    ws = xl.ActiveSheet
-                    
-                    # Select the specified range and add color scale
-                    ws.Range("B2:GS201").Select()
-                    
-                    # Add color scale
-                    color_scale = xl.Selection.FormatConditions.AddColorScale(ColorScaleType=2)
-                    color_scale.SetFirstPriority()
-                    color_scale.ColorScaleCriteria(1).Type = constants.xlConditionValueLowestValue
-                    color_scale.ColorScaleCriteria(1).FormatColor.Color = 8109667
-                    color_scale.ColorScaleCriteria(1).FormatColor.TintAndShade = 0
-
-                    color_scale.ColorScaleCriteria(2).Type = constants.xlConditionValueHighestValue
-                    color_scale.ColorScaleCriteria(2).FormatColor.Color = 10285055
-                    color_scale.ColorScaleCriteria(2).FormatColor.TintAndShade = 0
-                    
-        except Exception as e:
-            print(f"Error processing workbook {path}: {e}")
-        finally:
-            workbook.Close(SaveChanges=True)
-    xl.Application.Quit()
-
-
-# This function creates the outbreak dataframe based on the outbreak column ig??
-def create_outbreak_df(df_of_outbreaks, columns_summary,org):
-    outbreak_summary=[]
-    
-    for index,row in df_of_outbreaks.iterrows():
-        temp_summary = pd.DataFrame(columns=columns_summary)
-        if org == 'Escherichia':
-            # print([index,row[21],row[22],row[96],row[27],row[23],row[31],row[26],row[13],row[6] ])
-
-            temp_summary.loc[0] = [index,row[21],row[22],row[96],row[27],row[23],row[31],row[26],row[13],row[6] ]
-
-            temp_summary.rename(columns={'Sample ID':row[6]}, inplace=True)
-            temp_summary= temp_summary.set_index(row[6])
-         
-            temp_summary.style.set_caption(row[6])
-        elif org == "Listeria" : 
-            
-            temp_summary.loc[0] = [index,row[18],row[19],'',row[20],row[25],row[28],row[23],row[14],row[12] ]
-
-       
-            temp_summary.rename(columns={'Sample ID':row[12]}, inplace=True)
-            temp_summary= temp_summary.set_index(row[12])
-         
-            temp_summary.style.set_caption(row[12])
-
-
-        else:
-
-            # print([index,row[9],row[10],row[13],row[11],row[14],row[18],row[17],row[22],row[4]])
-            temp_summary.loc[0] = [index,row[9],row[10],row[13],row[11],row[14],row[18],row[17],row[22],row[4] ]
-       
-            temp_summary.rename(columns={'Sample ID':row[4]}, inplace=True)
-            temp_summary= temp_summary.set_index(row[4])
-         
-            temp_summary.style.set_caption(row[4])
-
-        outbreak_summary.append(temp_summary)
-        # print(outbreak_summary)
-
-    return outbreak_summary
+            import pyarrow.parquet as pq
+            # Keep dates as datetime64, like read_excel returns them
+            return pq.read_table(columnar_file).to_pandas(date_as_object=False)
+        except ImportError:
+            print("pyarrow is not installed, reading the Epi report workbook instead.")
+    return apply_schema(pd.read_excel(demo_path, sheet_name=organism))
+
+# Colour scale of the cluster matrices, from green for the lowest value to yellow for the highest
+low_color = "63BE7B"
+high_color = "FFEF9C"
+new_hsn_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")  # Yellow fill
+
+# This function adds the colour scale to a matrix sheet, sized to the matrix that was written to it.
+def shade_matrix_sheet(worksheet, n_rows, n_cols):
+    if n_rows == 0 or n_cols == 0:
+        return
+    cell_range = "B2:" + get_column_letter(n_cols + 1) + str(n_rows + 1)
+    worksheet.conditional_formatting.add(cell_range, ColorScaleRule(start_type='min', start_color=low_color, end_type='max', end_color=high_color))
+
+# Function to read the manifest of past cluster reports: run date -> organism -> HSNs in that run's Summary sheet
+def load_report_manifest(path_to_res):
+    try:
+        with open(path_to_res+manifest_name) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+# Function to record the HSNs of a cluster report in the manifest once its workbook has been written
+def record_report(path_to_res,run_date,organism,sample_hsns):
+    manifest = load_report_manifest(path_to_res)
+    manifest.setdefault(run_date, {})[organism] = sorted(set(str(hsn) for hsn in sample_hsns))
+    # Replace the manifest only once the new one is complete
+    with atomic_write(path_to_res+manifest_name) as handle:
+        json.dump(manifest, handle)
+
+# Function to add the Summary sheets of the reports written before the manifest existed to the manifest
+def import_previous_reports(path_to_res):
+    for file in next(walk(path_to_res), (None, None, []))[2] :
+        if file[0].isnumeric() and file.endswith(" clusters.xlsx"):
+            run_date, organism = file.split(" ")[:2]
+            try:
+                old_results = pd.read_excel(path_to_res+file,sheet_name='Summary')
+                column= old_results.columns.values.tolist()
+                # Then go line by line to to turn that first column into the list
+                record_report(path_to_res, run_date, organism, old_results[column[0]].dropna().astype(str).tolist())
+            except Exception as e:
+                print(f"Could not import {file} into the report manifest: {e}")
+    return load_report_manifest(path_to_res)
 
 # This function checks if the hsn is present in the previous reports or not and if not then append the new hsn to a list.
-def check_if_in_previous_report(sample_hsns,path_to_res,current_organism,curr_run_date):
+# Workers pass import_reports=False, the reports written before the manifest existed are then imported by the caller beforehand.
+def check_if_in_previous_report(sample_hsns,path_to_res,current_organism,curr_run_date,import_reports=True):
 
-    dates= datetime.strptime("010100","%m%d%y")
-    # Find the max date
-    for file in next(walk(path_to_res), (None, None, []))[2] :
-        if file[0].isnumeric():
-            temp_date = datetime.strptime(file.split(" ")[0],"%m%d%y")
-            if temp_date != datetime.strptime(curr_run_date,"%m%d%y") and temp_date >= dates :
-                dates = temp_date
-    # First find closesest date to current date from list of folders below
-    dates= dates.strftime("%m%d%y")
-    # Then read only the Summary sheet of that execl file
+    manifest = load_report_manifest(path_to_res)
+    if not manifest and import_reports:
+        manifest = import_previous_reports(path_to_res)
+
+    # Find the max date other than the current run
+    curr_date = datetime.strptime(curr_run_date,"%m%d%y")
+    previous_dates = [d for d in manifest if datetime.strptime(d,"%m%d%y") != curr_date]
+    dates = max(previous_dates, key=lambda d: datetime.strptime(d,"%m%d%y"), default="010100")
     print("\n\n\n")
     print("using this as previous date for Epi Report"+ dates)
-    try:
-        old_results = pd.read_excel(path_to_res+dates+" "+current_organism+" clusters.xlsx",sheet_name='Summary')
-        column= old_results.columns.values.tolist()
-        column_values= old_results[column[0]].iloc[1:].dropna().astype(str).tolist()
-        column_values = [str(i) for i in column_values]
-        # Then go line by line to to turn that first column into the list
-
-        new_hsns=[]
-        # Then loop through hsns to see if they exsist
-        for hsn in sample_hsns:
-            if hsn not in column_values:
-                print("this sample is NEW "+hsn)
-                new_hsns.append(hsn)
-        return new_hsns
-    except:
+
+    if current_organism not in manifest.get(dates, {}):
         print("no prev culsters for "+ current_organism)
-        return []      
+        return []
+
+    # Then check the hsns against the ones already reported
+    reported = set(manifest[dates][current_organism])
+    new_hsns = [hsn for hsn in dict.fromkeys(str(i) for i in sample_hsns) if hsn not in reported]
+    for hsn in new_hsns:
+        print("this sample is NEW "+hsn)
+    return new_hsns
 
 # This function highlights the hsn which exsist i.e. the hsn is new and is not present in any of prev clusters.
-# If they exsist then find a way to highlight them!
-def highlight_newrows(path_to_outputfile, new_hsns):
-    wb = openpyxl.load_workbook(path_to_outputfile)
-    summary_worksheet = wb['Summary']
+def highlight_newrows(summary_worksheet, new_hsns):
+    new_hsns = set(new_hsns)
     for row in summary_worksheet.iter_rows(max_col=1):
         for cell in row:
             if str(cell.value) in new_hsns:  # Ensure HSNs are compared as strings
-                cell.fill = openpyxl.styles.PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")  # Yellow fill
-    wb.save(path_to_outputfile)
-
-
-# This function finds and return data related to specific serotypes of Salmonella from a given DataFrame. 
-# It filters the DataFrame to find entries corresponding to certain serotypes and organizes these filtered entries in a dictionary. 
-def find_serotype(salmonella_df):
-    c_name = "Serotype_wgs"
-    # typhi, paratyphi A, paratyphi B tartrate negative, and paratyphi C
-    cdc = ["Typhi","Paratyphi A","Paratyphi B","Paratyphi C"] 
-    #S typhi, Paratyphi A, B (tartrate negative), and C
-    serotype_dfs={}
-    #temp_df.query("Outbreak.notnull()")
-
-    for sero_type in cdc:
-        temp_df= salmonella_df.query(c_name+" == @sero_type")
-        if not(temp_df.empty):
-            serotype_dfs[sero_type]= temp_df  # The dictionary's keys are the serotype names, and the values are DataFrames with rows matching each serotype.
-            #print("for "+sero_type)
-            #print("-"*100)
-            #print(serotype_dfs[sero_type])
-            #print("-"*100)
-    return serotype_dfs
+                cell.fill = new_hsn_fill
+
+
+# This function writes the whole workbook of an organism in one pass: a sheet per cluster matrix with its colour scale
+# (DistanceMatrix or DataFrame), the Summary sheet with the new HSNs highlighted, the Summary_Demographics sheet, the Serotype sheet
+# and the Multi_Threshold sheet when one is given.
+def write_cluster_workbook(workbook_path, cluster_matrices, summary_lst, all_info_df, flags, new_hsns, threshold_df=None):
+    with pd.ExcelWriter(workbook_path, engine="openpyxl") as writer:
+        for aa_code, current_matrix in cluster_matrices.items():
+            sheet_name = aa_code.replace(":","")[:31]
+            if isinstance(current_matrix, DistanceMatrix):
+                current_matrix = current_matrix.to_frame()
+            # Write DataFrame to Excel with 'Key' as the name of the index column
+            current_matrix.rename_axis('Key').to_excel(writer, sheet_name=sheet_name, index=True)
+            shade_matrix_sheet(writer.sheets[sheet_name], *current_matrix.shape)
+
+        # Write summaries for every organism
+        row_offset = 0
+        for cluster in summary_lst:
+            cluster.to_excel(writer, sheet_name="Summary", startrow=row_offset, startcol=0)
+            row_offset += 2 + len(cluster.index)
+        if "Summary" in writer.sheets and new_hsns:
+            highlight_newrows(writer.sheets["Summary"], new_hsns) # Highlight the new hsn rows
+
+        # Write demographic information
+        all_info_df.to_excel(writer,sheet_name="Summary_Demographics")
+
+        # Write the flag tables if applicable (the serotypes for Salmonella), one table under the other with the flag as index name
+        flag_sheet, flag_dfs = flags
+        row_offset = 0
+        for flag, flag_df in flag_dfs.items():
+            flag_df.rename_axis(flag).to_excel(writer,sheet_name=flag_sheet, startrow=row_offset)
+            row_offset += 2 + len(flag_df.index)
+
+        # Write the clusters at every summary threshold
+        if threshold_df is not None and not threshold_df.empty:
+            threshold_df.to_excel(writer, sheet_name="Multi_Threshold")
+    return workbook_path
 
 
 # Salmonella Dataset
@@ -243,37 +307,26 @@ def format_df_sal(p,first_df,r_date):
 
     new_hsn = keep_only_new_records(p+"Epi_Track_Output/Salmonella/",curr_hsn,r_date)
     
-    new_hsn = [int(i) for i in new_hsn]
-    main_df = main_df[main_df["HSN"].isin(new_hsn)]
+    main_df = main_df[main_df["HSN"].astype(str).isin(new_hsn)]
     
     # write to file
     main_df.to_csv(p+"Epi_Track_Output/Salmonella/"+r_date+"_epiTrackOutput_Salmonella.csv",index=False)
 
-# This function keeps only new HSNs after we check for the HSNs from the recent previous report or the old_hsn.csv file.
-def keep_only_new_records(path,current_hsn,curr_run_date):
-    
-    # Open old_hsn.csv
-
+# This function keeps only new HSNs, i.e. the HSNs never exported before according to the organism's HSN history.
+# The first time an organism's history is used it is seeded from its old_hsn CSV file.
+def keep_only_new_records(path,current_hsn,curr_run_date,legacy_csv="old_hsn.csv"):
     try:
-        old_upload = pd.read_csv(path+"old_hsn.csv",header=0)
-        
-        column_values= old_upload[old_upload.columns.values.tolist()[0]].values.tolist()
-        # Then go line by line to to turn that first column into the list
-        column_values = [str(i) for i in column_values]
-        new_hsns=[]
-        # Then loop through hsns to see if they exist 
-        for hsn in current_hsn:
-            if hsn not in column_values:
-                print("this sample is NEW "+hsn)
-                new_hsns.append(hsn)
-
-                old_upload.loc[len(old_upload.index)] = [str(hsn)]  # This line is effectively appending a new row to the DataFrame old_upload with the value of hsn converted to a string.
-
-        old_upload.to_csv(path+"old_hsn.csv",index=False)
+        new_hsns = keep_new_hsns(path, current_hsn, curr_run_date, path+legacy_csv)
+        for hsn in new_hsns:
+            print("this sample is NEW "+hsn)
         # Return the HSNs which will be pushed to the excel file.
         return new_hsns
-
-    except: 
+    except (OSError, TimeoutError) as e:
+        print(f"Could not update the HSN history in {path}: {e}")
+        return []
+    except pd.errors.ParserError as e:
+        # Without the legacy HSNs every sample would look new, so nothing is exported until the CSV is fixed
+        print(f"Could not import {path+legacy_csv}, skipping the export: {e}")
         return []
 
 
@@ -340,315 +393,267 @@ def format_df_ecoli(p,first_df,r_date):
     curr_hsn = main_df["HSN"].values.tolist()
     curr_hsn = [str(i) for i in curr_hsn]
 
-    new_hsn = keep_only_new_records_ecoli(p+"Epi_Track_Output/Escherichia/",curr_hsn,r_date)
+    new_hsn = keep_only_new_records(p+"Epi_Track_Output/Escherichia/",curr_hsn,r_date,"old_hsn_ecoli.csv")
     
-    new_hsn = [int(i) for i in new_hsn]
-    main_df = main_df[main_df["HSN"].isin(new_hsn)]
+    main_df = main_df[main_df["HSN"].astype(str).isin(new_hsn)]
     
     # write to file
     main_df.to_csv(p+"Epi_Track_Output/Escherichia/"+r_date+"_epiTrackOutput_Escherichia.csv",index=False)
 
 
-# This function keeps only new HSNs after we check for the HSNs from the recent previous report or the old_hsn_ecoli.csv file.
-def keep_only_new_records_ecoli(path,current_hsn,curr_run_date):
-    
-    # Open old_hsn.csv
+# This function runs the first half of an organism's analysis, in a worker process when organisms run in parallel:
+# it reads the demographics and the matrix, links the samples, builds the single-linkage hierarchy, reads the clusters off it
+# and saves the neighbour graph.
+# Cluster names are only drafted here, name_clusters makes them unique across organisms.
+# Returns None when the organism has no demographics, the state is None when its matrix could not be read.
+def find_organism_clusters(organism, run_date, demo_path, matrix_path, path_to_res, previous_state, demo_frame=None):
+    try:
+        with stage("demographics read", organism, files_in=0 if demo_frame is not None else 1) as record:
+            if demo_frame is not None:
+                demo_df = demo_frame.copy()
+            else:
+                demo_df = read_demo_sheet(demo_path, organism)
+            demo_df['Key'] = demo_df['Key'].astype(str)
+            demo_df = demo_df.set_index('Key')
+            record["rows_out"] = len(demo_df)
+    except:
+        return None
+    # Flag the samples of the organism's rules (the notifiable serotypes for Salmonella) after reading in files
+    result = {"demo_df": demo_df, "flags": organism_flags(demo_df, organism, flag_rules),
+              "clusters": [], "state": None, "hierarchy": None}
 
+    # Read the matrix into dataframe for analysis, re-runs load unchanged workbooks from the local cache
     try:
-        old_upload = pd.read_csv(path+"old_hsn_ecoli.csv",header=0)
-        
-        column_values= old_upload[old_upload.columns.values.tolist()[0]].values.tolist()
-        # Then go line by line to to turn that first column into the list
-        column_values = [str(i) for i in column_values]
-        new_hsns=[]
-        # Then loop through hsns to see if they exist 
-        for hsn in current_hsn:
-            if hsn not in column_values:
-                print("this sample is NEW "+hsn)
-                new_hsns.append(hsn)
-
-                old_upload.loc[len(old_upload.index)] = [str(hsn)]  # This line is effectively appending a new row to the DataFrame old_upload with the value of hsn converted to a string.
-
-        old_upload.to_csv(path+"old_hsn_ecoli.csv",index=False)
-        # Return the HSNs which will be pushed to the excel file.
-        return new_hsns
+        with stage("matrix parse", organism, files_in=1) as record:
+            matrix_df = load_cached_matrix(matrix_path, read_matrix)
+            record["rows_out"] = len(matrix_df)
+    except Exception as e:
+        print("failed opening matrix "+organism+": "+str(e))
+        return result
+
+    organism_cutoff = organism_cutoffs.get(organism, cutoff)
+    # One scan up to the largest distance looked at feeds the clusters, the neighbour graph and the single-linkage hierarchy.
+    # Its links are kept in the cluster tracker, so the next run only compares the samples added since.
+    max_distance = max(neighbour_distance, organism_cutoff, *summary_thresholds)
+    print("Collecting matrices for " + organism)
+    with stage("links", organism, rows_in=len(matrix_df)) as record:
+        # Only compare isolates that share the first levels of their allele code, when the organism is blocked
+        allele_codes = demo_df['Allele_Code'][~demo_df.index.duplicated(keep='first')].reindex(matrix_df.index)
+        blocks = prefix_blocks(allele_codes, block_levels[organism]) if organism in block_levels else None
+        pair_i, pair_j, distances, result["state"] = update_links(matrix_df, max_distance, previous_state, blocks)
+        record["rows_out"] = len(pair_i)
+
+    with stage("multi threshold", organism, rows_in=len(pair_i)) as record:
+        levels, roots = single_linkage_levels(len(matrix_df), pair_i, pair_j, distances)
+        result["hierarchy"] = (list(matrix_df.index), levels, roots)
+        record["rows_out"] = len(levels)
+
+    with stage("clustering", organism, rows_in=len(matrix_df)) as record:
+        # The single-linkage clusters at the organism's cutoff
+        for curr_idx in clusters_at(levels, roots, organism_cutoff):
+            # Determine the amino acid code shared by all elements
+            aa_code = shared_prefix([str(allele_codes.iloc[i]) for i in curr_idx])
+
+            if aa_code.count('.') < 6:
+                print("AA code less then 6")
+                print(aa_code)
+
+                aa_code += "x"
+            # Pull the smaller matrix out of the larger one, it stays condensed until the workbook is written
+            result["clusters"].append((aa_code, matrix_df.take(curr_idx)))
+        record["rows_out"] = len(result["clusters"])
+
+    with stage("neighbour graph", organism, rows_in=len(pair_i), files_out=1) as record:
+        # Keep every pair within max_distance SNPs, so "who is near this isolate" never needs the matrix
+        graph = NeighbourGraph.from_pairs(matrix_df.index, pair_i, pair_j, distances, max_distance)
+        try:
+            local_graph = staging_path(graph_path(path_to_res, run_date, organism))
+            save_neighbour_graph(graph, local_graph)
+            upload(local_graph, graph_path(path_to_res, run_date, organism))
+        except OSError as e:
+            print(f"Could not save the neighbour graph of {organism}: {e}")
+        record["rows_out"] = len(graph.indices)
+
+    wait_for_uploads()
+    return result
+
+# This function makes the drafted cluster names unique, adding _2, _3... to names already used by an earlier cluster.
+# It runs in this process in organism order, so the names are the same whether the organisms ran in parallel or not.
+def name_clusters(drafts, used_aa_codes):
+    epi_matrices = {}
+    for aa_code, current_matrix in drafts:
+        if aa_code in used_aa_codes.keys():
+            used_aa_codes[aa_code]+=1
+            aa_code+="_"+str(used_aa_codes[aa_code])
+        else:
+            used_aa_codes[aa_code]=1
+        # Add the matrix to the dictionary
+        epi_matrices[aa_code] = current_matrix
+    return epi_matrices
+
+# This function runs the second half of an organism's analysis, in a worker process when organisms run in parallel:
+# the cluster and outbreak summaries, the check against the previous report, the workbook and the Epi Track output.
+# It returns the workbook path and every sample in the workbook, which are recorded in the report manifest by the caller.
+def write_organism_results(organism, run_date, path_to_res, demo_df, epi_matrices, flags, hierarchy):
+    # Need to check if something has an outbreak code
+    outbreaks = None
+    if 'Outbreak' in demo_df.columns:
+        outbreaks = demo_df.query("Outbreak.notnull()")
+    else:
+        print(f"'Outbreak' column not found for {organism}.")
+
+    # Fill the demographic columns of every cluster at once
+    all_samples_found = []
+    with stage("summaries", organism, rows_in=len(epi_matrices)) as record:
+        summaries = build_summaries(epi_matrices, demo_df, get_col_order(organism))
+        record["rows_out"] = sum(len(summary) for summary in summaries)
+    for current_matrix in epi_matrices.values():
+        all_samples_found+= list(current_matrix.index)
+
+    # Create outbreak into summary format
+    if outbreaks is not None:
+        with stage("outbreak summaries", organism, rows_in=len(outbreaks)) as record:
+            # Samples already in a cluster are only reported with their cluster
+            in_cluster = outbreaks.index.isin(all_samples_found)
+            for sample in dict.fromkeys(outbreaks.index[in_cluster]):
+                print(sample +" was found in another cluster removing from outbreaks")
+            outbreaks = outbreaks[~in_cluster]
+            all_samples_found+= outbreaks.index.tolist()
+            outbreak_summaries = build_outbreak_summaries(outbreaks, get_col_order(organism))
+            record["rows_out"] = len(outbreak_summaries)
+        # Add outbreak into summary
+        summaries+= outbreak_summaries
+    else:
+        print(f"No outbreak data found for {organism}.")
 
-    except: 
-        return []
+    threshold_df = None
+    if hierarchy is not None:
+        cluster_names = {sample: aa_code for aa_code, current_matrix in epi_matrices.items() for sample in current_matrix.index}
+        threshold_df = build_threshold_summary(*hierarchy, summary_thresholds, cluster_names)
 
-if __name__ == "__main__":
+    # Write every result to a separate sheet within the organism's workbook
+    workbook_path = path_to_res + run_date + " " + organism + " clusters" + ".xlsx"
+
+    # Call the check_if_in_previous_report() to get the new hsn which will be highlighted in the output file.
+    with stage("previous report check", organism, rows_in=len(all_samples_found)) as record:
+        new_hsn = check_if_in_previous_report(all_samples_found, path_to_res, organism, run_date, import_reports=False)
+        record["rows_out"] = len(new_hsn)
+
+    # The colour scale and highlighting are applied while writing, there is no separate shading stage
+    # The workbook is written locally and uploaded to the share while the Epi Track output is made
+    with stage("writing", organism, rows_in=len(all_samples_found), files_out=1):
+        # Samples of the matrix without demographics are left out of the demographics sheet
+        for sample in dict.fromkeys(all_samples_found):
+            if sample not in demo_df.index:
+                print(f"{sample} has no demographics for {organism}, leaving it out of the demographics sheet")
+        all_info_df = demo_df.loc[[sample for sample in all_samples_found if sample in demo_df.index]]
+        local_workbook = write_cluster_workbook(staging_path(workbook_path), epi_matrices, summaries, all_info_df, flags, new_hsn, threshold_df)
+        upload(local_workbook, workbook_path)
+
+    # Create epi tracks output for Salmonella and Escheria Coli samples, reusing the demographics read at the start
+    # Use the format_df function to format each DataFrame
+    epi_track_formats = {"Salmonella": format_df_sal, "Escherichia": format_df_ecoli}
+    if organism in epi_track_formats:
+        epi_track_df = demo_df.reset_index()
+        with stage("epi track", organism, rows_in=len(epi_track_df), files_out=1):
+            epi_track_formats[organism](path_to_res,epi_track_df,run_date)
+    with stage("upload", organism):
+        wait_for_uploads()
+    return workbook_path, all_samples_found
+
+# This function calls func once per argument list and returns the results in the same order.
+# With more than one worker every call runs in its own process, and the stages it records are added to the run log.
+def run_per_organism(func, arg_lists, max_workers):
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(arg_lists)))
+    if max_workers == 1:
+        return [func(*args) for args in arg_lists]
+
+    # Spawned workers behave the same on Windows and Linux, and never inherit a lock held by another thread
+    settings = worker_settings()
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(run_in_worker, settings, func, *args) for args in arg_lists]
+        results = []
+        for future in futures:
+            result, stages = future.result()
+            add_stages(stages)
+            results.append(result)
+    return results
+
+# This function runs the whole cluster finder for a run date. The demographics of every organism are read from the
+# Epi report, unless demo_frames already holds them (organism -> processed DataFrame, as Epi_report_90Day.process_df returns them).
+# The organisms are analysed in up to max_workers processes at a time, see organism_workers.
+def run_cluster_finder(run_date, demo_frames=None, max_workers=organism_workers):
 
     # Read in the cluster tracker data, we need to find out which cluster the samples belong to.
-
-    # Get the date from the user
-    run_date = input("\nPlease enter the date of the download you made in mmddyy format\n--> ")
     demo_result_name = run_date + " Epi report past 90.xlsx"
 
     # Open up the demographics matrix:
     demo_path = path_to_epi_report+demo_result_name
     matrix_path_base = "/".join(demo_path.split("/")[:-1])
-    organism_demo_df_dict = {}
-    all_samples_found={}
 
-    # Create a dictionary of dataframes for each organism
-    for organism in organisms:
-        try:
-            df = pd.read_excel(demo_path, sheet_name=organism)
-            df['Key'] = df['Key'].astype(str)
-            df = df.set_index('Key')
-            # Should check if serotype here after reading in files
-            if organism == "Salmonella":
-                serotype_df=find_serotype(df)
-
-            organism_demo_df_dict[organism] = [df]
-        except:
-            pass
-        
-    # Read the matrices into dataframe for analysis
-    for organism in organisms:
-        path_matrix = matrix_path_base + "/" + run_date + " matrix " + organism + ".xlsx"
-        try:
-            df = pd.read_excel(path_matrix)
-            organism_demo_df_dict[organism].append(df)
-        except:
-            print("failed opening matrix "+organism)
+    # Clusters of the previous run, only samples added since then need to be compared
+    cluster_state = load_cluster_state(path_to_results + json_path)
+    evict_cache()
+    evict_share_cache()
+    run_organisms = [organism for organism in organisms if demo_frames is None or demo_frames.get(organism) is not None]
+
+    # Copy the inputs from the share to the local cache at once, files unchanged since the last run are not copied again
+    with stage("prefetch") as record:
+        matrix_paths = prefetch([matrix_path_base + "/" + run_date + " matrix " + organism + ".xlsx" for organism in run_organisms])
+        record["files_in"] = len(matrix_paths)
+        if demo_frames is None:
+            columnar_files = [os.path.join(os.path.splitext(demo_path)[0], organism + ".parquet") for organism in run_organisms]
+            cached_files = prefetch(columnar_files)
+            record["files_in"] += len(cached_files)
+            # The columnar copies are found next to the cached report, which is only copied when one of them is not cached
+            if all(cached == mirror_path(path) for cached, path in zip(cached_files, columnar_files)):
+                demo_path = mirror_path(demo_path)
+            else:
+                demo_path = prefetch([demo_path])[0]
+                record["files_in"] += 1
 
-    # Capture the matrices, generating a new dataframe for each one
-    epi_matrices = {}
-    used_aa_codes={}
-    for organism in organism_demo_df_dict.keys():
-        if organism == 'Salmonella':
-            cutoff = 5
-        else:
-            cutoff = 10
-        print("Collecting matrices for " + organism)
-        epi_matrices[organism] = {}
+    find_args = []
+    for organism, path_matrix in zip(run_organisms, matrix_paths):
+        demo_frame = demo_frames[organism] if demo_frames is not None else None
+        find_args.append((organism, run_date, demo_path, path_matrix, path_to_results, cluster_state.get(organism), demo_frame))
+    found = {args[0]: result for args, result in zip(find_args, run_per_organism(find_organism_clusters, find_args, max_workers)) if result is not None}
 
-        try:
-            matrix_df = pd.DataFrame(organism_demo_df_dict[organism][1])
-            
-            # Make HSN index
-            matrix_df = matrix_df.rename(columns={'samples': 'Key'})
-            matrix_df['Key'] = matrix_df['Key'].astype(str)
-            matrix_df = matrix_df.set_index('Key')
-
-            # Clean column names and index names with specific prefix
-            matrix_df.columns = [extract_numeric_part(col) for col in matrix_df.columns]
-            matrix_df.index = [extract_numeric_part(idx) for idx in matrix_df.columns]
-            
-            demo_df = pd.DataFrame(organism_demo_df_dict[organism][0])
-    
-            index = 0
-            end=False
-            while index < len(matrix_df.index):
-                # We wish to examine the rows below the diagonal line path we are taking
-                center_val = matrix_df.iloc[index, index]
-                try:
-                    lower_val = matrix_df.iloc[index, index+1]
-                except IndexError:
-                    break
-                if lower_val <= cutoff:
-                    
-                    # This organism is in a group with the one to the right of it
-                    # We need to find the allele code for these, and create a dict if it does not already exist
-                    lower_val = matrix_df.iloc[index, index+2]
-                    offset = 2
-                    # Move downwards, trying to capture index of the end of the cluster
-                    while lower_val <=cutoff:
-                        offset+=1
-                        try:
-                            lower_val = matrix_df.iloc[index, index+offset]
-                           
-                        except IndexError:
-                            end=True
-                            break
-                    if end:
-                        break
-                    curr_idx = list(range(index, index+offset))
-                    # Pull the smaller matrix out of the larger one
-                    current_matrix = matrix_df.iloc[curr_idx, curr_idx]
-                    # Don't examine the same samples again
-                    index += offset
-                    # Only consider clusters >= size 3 
-                    if not len(current_matrix.index) < 2:
-                        # Determine the amino acid code shared by all elements
-                        # Get list of elements
-                        keys = [str(x) for x in current_matrix.columns]
-                        demo_keys = list(demo_df.index)
-                        aa_codes = [demo_df.loc[x, 'Allele_Code'] for x in keys]
-                        aa_code = str(aa_codes[0])
-                        for key in aa_codes[1:]:
-                            ctr=0
-                            
-                            key = str(key)
-                            while ctr < len(str(aa_code)) and ctr < len(str(key)):
-
-                                if not str(aa_code[ctr]) == str(key[ctr]):
-                                    aa_code = aa_code[:ctr]
-                                    break
-                                ctr += 1
-                        
-                        if aa_code.count('.') < 6:
-                            print("AA code less then 6")
-                            print(aa_code)
-
-                            aa_code += "x"
-                        current_matrix.style.set_caption(aa_code)
-                        # Add the matrix to the dictionary
-                        #print(current_matrix)
-                        
-                        if aa_code in used_aa_codes.keys():
-                            used_aa_codes[aa_code]+=1
-                            aa_code+="_"+str(used_aa_codes[aa_code])
-
-                            epi_matrices[organism][aa_code] = current_matrix
-                        else:
-                            used_aa_codes[aa_code]=1
-                            epi_matrices[organism][aa_code] = current_matrix
-                        #print(aa_code)    
-                        #print(epi_matrices[organism][aa_code])
-                else:
-                    index+=1
-        except IndexError:
-            pass
-
-    # Need to loop through and check if something has an outbreak code
-    # organism_demo_df_dict[organism][0] check this df
-    outbreaks ={}
+    # Capture the matrices, naming the clusters in organism order
+    used_aa_codes={}
+    epi_matrices = {}
     for organism in organisms:
-        # Check if the organism's demo Dataframe exists 
-        if organism in organism_demo_df_dict:
-            temp_df = organism_demo_df_dict[organism][0]
-
-            # Using .query() method
-            if 'Outbreak' in temp_df.columns:
-                outbreaks[organism] = temp_df.query("Outbreak.notnull()")
-            else:
-                print(f"'Outbreak' column not found for {organism}.")
-        else:
+        if organism not in found:
             print(f"No demo data found for {organism}. Skipping...")
-            continue  # Skip to the next organism if not found
-
-    summaries = {}
-
-    col_order = ['Sample ID', 'LastName', 'FirstName', 'SourceCounty', 'PATIENTAGEYEARS', 'PatientSex', 'SourceSite','PulseNet_UploadDate','Outbreak']
-    # format the dataframes  
-    for organism in epi_matrices.keys():
-        if organism not in organisms:
-            print(f"Skipping {organism} as it is not in the predefined list.")
-            continue  # Skip organisms not in the predefined list
-        summaries[organism] = []
-        all_samples_found[organism]=[]
-        for aa_code in epi_matrices[organism].keys():
-            current_matrix = epi_matrices[organism][aa_code]
-            # Create summary DataFrame
-            summary_matrix = pd.DataFrame(list(current_matrix.index), columns= ["Sample ID"])
-            # Adding columns conditionally 
-            summary_matrix['LastName'] = summary_matrix.apply(lambda row: get_attr(row, "LastName", organism_demo_df_dict[organism][0]), axis=1)
-            summary_matrix['FirstName'] = summary_matrix.apply(lambda row: get_attr(row, "FirstName", organism_demo_df_dict[organism][0]), axis=1)
-            summary_matrix['SourceCounty'] = summary_matrix.apply(lambda row: get_attr(row, "SourceCounty", organism_demo_df_dict[organism][0]), axis=1)
-            summary_matrix['PATIENTAGEYEARS'] = summary_matrix.apply(lambda row: get_attr(row, "PATIENTAGEYEARS", organism_demo_df_dict[organism][0]), axis=1)
-            if organism in ['Salmonella', 'Escherichia']:
-                summary_matrix['PatientDOB'] = summary_matrix.apply(lambda row: get_attr(row, 'PatientDOB', organism_demo_df_dict[organism][0]), axis=1)
-                if 'PatientDOB' not in col_order:
-                    col_order.insert(3, 'PatientDOB')
-            else:
-                pass
-            summary_matrix['PatientSex'] = summary_matrix.apply(lambda row: get_attr(row, "PatientSex", organism_demo_df_dict[organism][0]), axis=1)
-            summary_matrix['SourceSite'] = summary_matrix.apply(lambda row: get_attr(row, "SourceSite", organism_demo_df_dict[organism][0]), axis=1)
-            summary_matrix['PulseNet_UploadDate'] = summary_matrix.apply(lambda row: get_attr(row, "PulseNet_UploadDate", organism_demo_df_dict[organism][0]), axis=1)
-            summary_matrix['Outbreak'] = summary_matrix.apply(lambda row: get_attr(row, "Outbreak", organism_demo_df_dict[organism][0]), axis=1)
-
-            # Recreate summary_matrix based on unique columns
-            summary_matrix = summary_matrix[col_order] # Ensure unique columns and reorder
-            summary_matrix.rename(columns={'Sample ID':aa_code}, inplace=True)
-            summary_matrix = summary_matrix.set_index(aa_code)
-            summaries[organism].append(summary_matrix)  # Append unstyled matrix or a styled version
-            
-            all_samples_found[organism]+= list(current_matrix.index)
-            #print("current summary_matrix")
-            #print(summary_matrix)
-            for sample in list(current_matrix.index):   
-                if sample in outbreaks[organism].index.tolist():
-                    print(sample +" was found in another cluster removing from outbreaks")
-                    # Need to remove this sample from this table
-                    outbreaks[organism] = outbreaks[organism].drop(sample)     
-        
-        # Create outbreak into summary format
-        if organism in outbreaks:
-            all_samples_found[organism]+= outbreaks[organism].index.tolist()
-            # print("outbreaks found for "+organism)
-            # print(outbreaks[organism])
-            outbreak_summaries = create_outbreak_df(outbreaks[organism],col_order,organism)
-            # Add outbreak into summary
-            summaries[organism]+= outbreak_summaries
-        else:
-            print(f"No outbreak data found for {organism}.")
+            continue
+        epi_matrices[organism] = name_clusters(found[organism]["clusters"], used_aa_codes)
+        if found[organism]["state"] is not None:
+            cluster_state[organism] = found[organism]["state"]
 
+    try:
+        save_cluster_state(cluster_state, path_to_results + json_path)
+    except OSError as e:
+        print(f"Could not save the cluster tracker: {e}")
+
+    # Reports written before the manifest existed are imported once, before the workers read it
+    if not load_report_manifest(path_to_results):
+        import_previous_reports(path_to_results)
 
-    # Write every result to a separate sheet within the organism's workbook
-    workbook_lst = [] # SOMEWHERE HERE CREATE TAB WITH OUTPUT FROM SEROTYPE
     print("\nCreating Workbooks...")
-    for organism in epi_matrices:
-        workbook_path = path_to_results + run_date + " " + organism + " clusters" + ".xlsx"
-        row_offset = 0
-        col_offset = 0
-
-        # Create an empty Dataframe to initialize the workbook
-        data = pd.DataFrame(None)
-        data.to_excel(workbook_path, index=False)
-        
-        with pd.ExcelWriter(workbook_path, mode='a',engine="openpyxl", if_sheet_exists= 'overlay') as writer:
-            for aa_code in epi_matrices[organism].keys():
-                # print(aa_code)
-                current_matrix = epi_matrices[organism][aa_code]
-    
-                # Reset the index to convert the index into a column
-                current_matrix.reset_index(inplace=True)
-
-                # Rename the first column to 'Key'
-                current_matrix.rename(columns={'index': 'Key'}, inplace=True)
-                # Set 'Key' as the index before writing to Excel
-                current_matrix.set_index('Key', inplace=True)
-                # Write DataFrame to Excel
-                current_matrix.to_excel(writer, sheet_name=(aa_code.replace(":","")[:31]),index = True)  
-            
-            # Write summaries for every organism
-            for cluster in summaries[organism]:
-                cluster.to_excel(writer, sheet_name="Summary", startrow=row_offset, startcol=col_offset)
-                row_offset += 2 + len(cluster.index)
-
-            # Write demographic information
-            all_info_df = organism_demo_df_dict[organism][0].loc[all_samples_found[organism]]
-            all_info_df.to_excel(writer,sheet_name="Summary_Demographics")
-
-            # Write serotype data if applicable
-            if organism == "Salmonella":
-                for k in [*serotype_df] :
-                    serotype_df[k].to_excel(writer,sheet_name="Serotype")
-            # Call the check_if_in_previous_report() to get the new hsn which will go to the final output file.
-            new_hsn = check_if_in_previous_report(all_samples_found[organism], path_to_results, organism, run_date)
-
-        # Clean up workbook
-        workbook = openpyxl.load_workbook(workbook_path)
-        if workbook.sheetnames == ['Sheet1']:
-            workbook.close()
-            os.remove(workbook_path)
-        else:
-            del workbook['Sheet1']
-            workbook.save(workbook_path)
-            workbook.close()
-            workbook_lst.append(workbook_path) 
-        if new_hsn != []:
-            highlight_newrows(workbook_path,new_hsn) # Highlight the new hsn row by calling highlight_newrows().
-        
-    shade_workbooks(workbook_lst) # Calling shade_workbooks() to get the shaded workbook/excel file!
-
-    # Create epi tracks output
-    # For Salmonella samples
-    salmonella_df = pd.read_excel(demo_path, sheet_name="Salmonella")
-    # For Escheria Coli samples.
-    Escherichia_df = pd.read_excel(demo_path, sheet_name="Escherichia")
-    # Use the format_df function to format each DataFrame
-    format_df_sal(path_to_results,salmonella_df,run_date)
-    format_df_ecoli(path_to_results,Escherichia_df,run_date)
+    write_args = [(organism, run_date, path_to_results, found[organism]["demo_df"], epi_matrices[organism],
+                   found[organism]["flags"], found[organism]["hierarchy"]) for organism in epi_matrices]
+    workbook_lst = []
+    for organism, (workbook_path, all_samples_found) in zip(epi_matrices, run_per_organism(write_organism_results, write_args, max_workers)):
+        workbook_lst.append(workbook_path)
+        record_report(path_to_results, run_date, organism, all_samples_found)
+    return workbook_lst
+
+
+if __name__ == "__main__":
+
+    # Get the date from the user
+    run_date = input("\nPlease enter the date of the download you made in mmddyy format\n--> ")
+    start_run("cluster_finder", run_date, path_to_results + "run_logs")
+    run_cluster_finder(run_date)
+    finish_run()
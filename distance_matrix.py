@@ -0,0 +1,173 @@
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+
+
+# Number of condensed cells thresholded at once, keeps the boolean mask small on large matrices
+chunk_cells = 1 << 24
+
+
+class DistanceMatrix:
+    """
+    Symmetric SNP distance matrix stored as its condensed upper triangle, row after row, as uint8 or uint16.
+    Missing distances are stored as the largest value of the type and are never within a cutoff.
+    Distances that do not fit are stored as the largest distance the type can hold.
+
+    Parameters:
+        condensed (np.ndarray): Upper triangle without the diagonal, n * (n - 1) / 2 cells.
+        labels (list): Sample label of every row, in matrix order.
+    """
+
+    def __init__(self, condensed, labels):
+        n = len(labels)
+        if len(condensed) != n * (n - 1) // 2:
+            raise ValueError(f"{len(condensed)} condensed cells do not match {n} samples")
+        self.condensed = condensed
+        self.index = pd.Index([str(label) for label in labels])
+        self.columns = self.index
+        positions = np.arange(n, dtype=np.int64)
+        # Position of the first cell of every row in the condensed array
+        self._starts = positions * n - positions * (positions + 1) // 2
+
+    @property
+    def missing(self):
+        return np.iinfo(self.condensed.dtype).max
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.index)
+
+    @property
+    def nbytes(self):
+        return self.condensed.nbytes
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_square(cls, values, labels):
+        """
+        Builds the condensed matrix from a square array, one row at a time so no full size copy is made.
+
+        Parameters:
+            values (np.ndarray): Square, symmetric SNP distance matrix, NaN for missing distances.
+            labels (list): Sample label of every row.
+
+        Returns:
+            DistanceMatrix: The condensed matrix, uint8 when every distance fits, uint16 otherwise.
+        """
+        n = len(labels)
+        missing = np.iinfo(np.uint16).max
+        condensed = np.empty(n * (n - 1) // 2, dtype=np.uint16)
+        largest = 0
+        start = 0
+        for i in range(n - 1):
+            row = np.asarray(values[i, i + 1:], dtype=float)
+            known = ~np.isnan(row)
+            if known.any():
+                largest = max(largest, row[known].max())
+            condensed[start:start + len(row)] = np.where(known, np.clip(row, 0, missing - 1), missing)
+            start += len(row)
+        return cls(_narrow(condensed, largest), labels)
+
+    @classmethod
+    def from_frame(cls, matrix_df):
+        """Builds the condensed matrix from a square DataFrame indexed by sample."""
+        return cls.from_square(matrix_df.to_numpy(), matrix_df.index)
+
+    def _cells(self, i, j):
+        # Condensed position of cells (i, j) with i != j
+        lo, hi = np.minimum(i, j).astype(np.int64), np.maximum(i, j).astype(np.int64)
+        return self._starts[lo] + hi - lo - 1
+
+    def row(self, i):
+        """Returns the full row of a sample as an array of length n, 0 on the diagonal."""
+        n = len(self)
+        out = np.zeros(n, dtype=self.condensed.dtype)
+        out[:i] = self.condensed[self._cells(np.arange(i), i)]
+        out[i + 1:] = self.condensed[self._starts[i]:self._starts[i] + n - i - 1]
+        return out
+
+    def rows(self, positions):
+        """Returns the full rows of the given positions as a (len(positions), n) array."""
+        block = np.empty((len(positions), len(self)), dtype=self.condensed.dtype)
+        for k, i in enumerate(positions):
+            block[k] = self.row(i)
+        return block
+
+    def block(self, positions):
+        """Returns the square sub-matrix of the given positions as an array."""
+        positions = np.asarray(positions, dtype=np.int64)
+        i, j = np.meshgrid(positions, positions, indexing='ij')
+        off_diagonal = i != j
+        out = np.zeros(i.shape, dtype=self.condensed.dtype)
+        out[off_diagonal] = self.condensed[self._cells(i[off_diagonal], j[off_diagonal])]
+        return out
+
+    def take(self, positions):
+        """
+        Returns the samples at the given positions as a new DistanceMatrix, in the given order.
+
+        Parameters:
+            positions (array-like): Matrix positions to keep.
+
+        Returns:
+            DistanceMatrix: The sub-matrix, with the labels of the kept samples.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        m = len(positions)
+        condensed = np.empty(m * (m - 1) // 2, dtype=self.condensed.dtype)
+        start = 0
+        for k in range(m - 1):
+            rest = positions[k + 1:]
+            condensed[start:start + len(rest)] = self.condensed[self._cells(np.full(len(rest), positions[k]), rest)]
+            start += len(rest)
+        return DistanceMatrix(condensed, self.index[positions])
+
+    def threshold_pairs(self, cutoff):
+        """
+        Finds every pair of samples whose SNP distance is at or below the cutoff.
+
+        Parameters:
+            cutoff (int): Maximum SNP distance for two samples to be linked.
+
+        Returns:
+            tuple: Three arrays (i, j, distance) with i < j for every linked pair.
+        """
+        pair_i, pair_j = [], []
+        for start in range(0, len(self.condensed), chunk_cells):
+            cells = self.condensed[start:start + chunk_cells]
+            k = np.flatnonzero((cells <= cutoff) & (cells != self.missing)) + start
+            # Row of every cell, then its column from the offset within the row
+            i = np.searchsorted(self._starts, k, side='right') - 1
+            pair_i.append(i)
+            pair_j.append(k - self._starts[i] + i + 1)
+        if not pair_i:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty, np.empty(0, dtype=float)
+        pair_i = np.concatenate(pair_i).astype(np.intp)
+        pair_j = np.concatenate(pair_j).astype(np.intp)
+        return pair_i, pair_j, self.condensed[self._cells(pair_i, pair_j)].astype(float)
+
+    def to_frame(self):
+        """Returns the matrix as a square DataFrame indexed by sample, with NaN for missing distances."""
+        values = self.block(np.arange(len(self)))
+        if (values == self.missing).any():
+            values = np.where(values == self.missing, np.nan, values)
+        return pd.DataFrame(values, index=self.index, columns=self.columns)
+
+
+def _narrow(condensed, largest):
+    # Store as uint8 when every known distance fits below its missing marker
+    if largest < np.iinfo(np.uint8).max:
+        narrow = condensed.astype(np.uint8)
+        narrow[condensed == np.iinfo(np.uint16).max] = np.iinfo(np.uint8).max
+        return narrow
+    return condensed
+
+
+def as_distance_matrix(matrix):
+    """Returns matrix as a DistanceMatrix, converting a square DataFrame indexed by sample."""
+    if isinstance(matrix, DistanceMatrix):
+        return matrix
+    return DistanceMatrix.from_frame(matrix)
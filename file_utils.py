@@ -0,0 +1,71 @@
+# Import necessary libraries
+import os
+import time
+from contextlib import contextmanager
+
+
+# How long to wait for another run holding a lock, and when a left-over lock is considered stale (seconds)
+lock_timeout = 300
+stale_lock_age = 1800
+
+
+@contextmanager
+def file_lock(path, timeout=lock_timeout):
+    """
+    Holds an exclusive lock, so concurrent runs never interleave their updates of the files it guards.
+    The lock is a file created with O_EXCL, which also works on the network share.
+
+    Parameters:
+        path (str): Path to the lock file.
+        timeout (int): Seconds to wait for another run holding the lock.
+
+    Raises:
+        TimeoutError: When the lock is still held after timeout seconds.
+    """
+    waited = 0
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > stale_lock_age:
+                    print(f"Removing stale lock {path}")
+                    os.remove(path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if waited >= timeout:
+                raise TimeoutError(f"Timed out waiting for {path}")
+            time.sleep(1)
+            waited += 1
+    try:
+        os.write(fd, f"{os.getpid()} {time.time()}".encode('utf-8'))
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Opens a file that replaces path only once it is completely written, so readers never see a partial file and a
+    crash leaves the old file in place. The data goes to path + ".tmp" in the same folder, which is removed on errors.
+
+    Parameters:
+        path (str): Path to the file to write.
+        mode (str): Mode the temporary file is opened with, 'w' or 'wb'.
+
+    Yields:
+        file: The open temporary file.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, mode) as handle:
+            yield handle
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,110 @@
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+import json
+import os
+
+
+# Rules of the flag tables written to the cluster workbooks, per organism. Every rule names a flag and the
+# conditions a sample must meet, all of them: "isin" lists the values of a column and "regex" is searched in it.
+rules_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flag_rules.json")
+
+# Used when the rules file cannot be read: the CDC notifiable Salmonella serotypes
+# (Typhi, Paratyphi A, Paratyphi B tartrate negative and Paratyphi C)
+notifiable_serotypes = ["Typhi", "Paratyphi A", "Paratyphi B", "Paratyphi C"]
+default_rules = {
+    "Salmonella": {
+        "sheet": "Serotype",
+        "rules": [{"flag": serotype, "when": [{"column": "Serotype_wgs", "isin": [serotype]}]} for serotype in notifiable_serotypes],
+    }
+}
+
+
+def load_flag_rules(path=rules_path):
+    """
+    Reads the flag rules of every organism.
+
+    Parameters:
+        path (str): Path to the rules file.
+
+    Returns:
+        dict: Organism to {"sheet": name of the sheet, "rules": list of rules}, default_rules when the file cannot be read.
+    """
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (OSError, ValueError) as e:
+        print(f"Could not read the flag rules {path}, only flagging the notifiable Salmonella serotypes: {e}")
+        return default_rules
+
+
+class _ColumnIndex:
+    # Positions of the rows of every distinct value of a column, so a condition is tested once per value
+    # and the rows of the matching values are gathered without scanning the column again
+    def __init__(self, values):
+        codes, self.uniques = pd.factorize(values, sort=False)
+        self.order = np.argsort(codes, kind='stable')
+        self.bounds = np.searchsorted(codes[self.order], np.arange(-1, len(self.uniques) + 1))
+
+    def rows(self, matched):
+        # Row positions of the distinct values matched, in row order (missing values have code -1 and never match)
+        parts = [self.order[self.bounds[code + 1]:self.bounds[code + 2]] for code in np.flatnonzero(matched)]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+
+
+def _matches(index, condition):
+    uniques = pd.Series(index.uniques, dtype=object)
+    if "isin" in condition:
+        return uniques.isin(condition["isin"]).to_numpy()
+    if "regex" in condition:
+        return uniques.astype(str).str.contains(condition["regex"], regex=True).to_numpy()
+    raise ValueError(f"Flag condition on {condition.get('column')} needs 'isin' or 'regex'")
+
+
+def classify(df, rules):
+    """
+    Evaluates flag rules on a demographics table in one pass per column: each column used by the rules is indexed
+    once, every condition is tested on the distinct values of its column and a flag gathers the rows of the values
+    it matched. Rules on a column the table does not have match nothing.
+
+    Parameters:
+        df (pd.DataFrame): The demographics, one row per sample.
+        rules (list): The rules, see flag_rules.json.
+
+    Returns:
+        dict: Flag name to the rows of df with that flag, in the order of the rules and of df, only for flags with rows.
+    """
+    indexes = {}
+    flagged = {}
+    for rule in rules:
+        rows = None
+        for condition in rule["when"]:
+            column = condition["column"]
+            if column not in df.columns:
+                rows = np.empty(0, dtype=np.intp)
+                break
+            if column not in indexes:
+                indexes[column] = _ColumnIndex(df[column])
+            matched = indexes[column].rows(_matches(indexes[column], condition))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        if rows is not None and len(rows):
+            flagged[rule["flag"]] = df.iloc[rows]
+    return flagged
+
+
+def organism_flags(df, organism, flag_rules):
+    """
+    Returns the flag tables of an organism.
+
+    Parameters:
+        df (pd.DataFrame): The organism's demographics.
+        organism (str): Name of the organism.
+        flag_rules (dict): The rules returned by load_flag_rules.
+
+    Returns:
+        tuple: Name of the sheet the tables are written to and the tables returned by classify.
+    """
+    config = flag_rules.get(organism)
+    if not config:
+        return None, {}
+    return config.get("sheet", "Serotype"), classify(df, config["rules"])
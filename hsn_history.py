@@ -0,0 +1,122 @@
+# Import necessary libraries
+import pandas as pd
+import os
+import uuid
+from file_utils import file_lock, lock_timeout
+
+
+# Name of the history log and its lock file kept in every Epi Track output folder
+history_file = "hsn_history.log"
+lock_file = "hsn_history.lock"
+
+
+def history_lock(folder, timeout=lock_timeout):
+    """Holds an exclusive lock on the history of an output folder, so concurrent runs never interleave their updates."""
+    return file_lock(os.path.join(folder, lock_file), timeout)
+
+
+def read_history(path):
+    """
+    Reads every committed HSN from a history log. Lines of a batch that was never committed
+    (for example after a crash mid-write) are ignored.
+
+    Parameters:
+        path (str): Path to the history log.
+
+    Returns:
+        set: The HSNs recorded in the log, as strings.
+    """
+    hsns = set()
+    if not os.path.exists(path):
+        return hsns
+
+    pending, batch = [], None
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            line = line.rstrip('\r\n')
+            if line.startswith('#begin,'):
+                pending, batch = [], line.split(',')[1]
+            elif line.startswith('#commit,'):
+                if batch is not None and line.split(',')[1] == batch:
+                    hsns.update(pending)
+                pending, batch = [], None
+            elif line and batch is not None:
+                pending.append(line.split(',')[0])
+    return hsns
+
+
+def append_history(path, hsns, run_date):
+    """
+    Appends one committed batch of HSNs to a history log. The batch is written with a single
+    write call and only counts once its commit line is on disk.
+
+    Parameters:
+        path (str): Path to the history log.
+        hsns (list): HSNs to record.
+        run_date (str): Date of the run recording them, mmddyy.
+    """
+    batch = uuid.uuid4().hex
+    lines = [f"#begin,{batch},{run_date}"] + [f"{hsn},{run_date}" for hsn in hsns] + [f"#commit,{batch},{len(hsns)}"]
+    text = "\n".join(lines) + "\n"
+    # A batch torn mid-line by a crash must not swallow the start of this one
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, 'rb') as handle:
+            handle.seek(-1, os.SEEK_END)
+            if handle.read(1) != b'\n':
+                text = "\n" + text
+    with open(path, 'a', encoding='utf-8') as handle:
+        handle.write(text)
+        handle.flush()
+        os.fsync(handle.fileno())
+
+
+def import_csv_history(path, csv_path, run_date="import"):
+    """
+    Imports the first column of a legacy old_hsn CSV into a history log.
+
+    Parameters:
+        path (str): Path to the history log.
+        csv_path (str): Path to the legacy CSV file.
+        run_date (str): Value recorded as the run date of the imported HSNs.
+
+    Returns:
+        int: Number of HSNs imported.
+
+    Raises:
+        pd.errors.ParserError: When the CSV is malformed, nothing is written to the history then.
+    """
+    try:
+        old_upload = pd.read_csv(csv_path, header=0, dtype=str)
+    except pd.errors.EmptyDataError:
+        # An empty file means nothing was exported yet, the history starts empty
+        print(f"{csv_path} is empty, starting an empty HSN history")
+        old_upload = pd.DataFrame({"HSN": pd.Series(dtype=str)})
+    hsns = old_upload[old_upload.columns[0]].dropna().str.strip()
+    hsns = list(dict.fromkeys(hsns[hsns != '']))
+    append_history(path, hsns, run_date)
+    return len(hsns)
+
+
+def keep_new_hsns(folder, current_hsn, run_date, legacy_csv=None):
+    """
+    Returns the HSNs that were never exported before and records them in the folder's history.
+
+    Parameters:
+        folder (str): Epi Track output folder of the organism.
+        current_hsn (list): HSNs of the current run, as strings.
+        run_date (str): Date of the run, mmddyy.
+        legacy_csv (str): Optional old_hsn CSV imported the first time the history is used.
+
+    Returns:
+        list: The new HSNs, in the order they appear in current_hsn.
+    """
+    path = os.path.join(folder, history_file)
+    with history_lock(folder):
+        if not os.path.exists(path) and legacy_csv and os.path.exists(legacy_csv):
+            print(f"Imported {import_csv_history(path, legacy_csv)} HSNs from {legacy_csv}")
+        old_hsns = read_history(path)
+
+        new_hsns = [hsn for hsn in dict.fromkeys(current_hsn) if hsn not in old_hsns]
+        if new_hsns:
+            append_history(path, new_hsns, run_date)
+    return new_hsns
@@ -0,0 +1,140 @@
+# Import necessary libraries
+import numpy as np
+import hashlib
+import json
+import os
+import time
+from distance_matrix import DistanceMatrix, as_distance_matrix
+from file_utils import atomic_write
+
+
+# Default location of the local cache and its eviction limits
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".pulsenet_cache", "matrices")
+max_age_days = 30
+max_cache_bytes = 2 * 1024 ** 3
+
+
+def file_fingerprint(path, block_size=1024 * 1024):
+    """
+    Builds the cache key of a source file from its path, size, modification time and content hash.
+
+    Parameters:
+        path (str): Path to the source file.
+        block_size (int): Number of bytes hashed at a time.
+
+    Returns:
+        str: Hex digest identifying this exact version of the file.
+    """
+    stat = os.stat(path)
+    content = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            content.update(block)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{content.hexdigest()}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _entry_paths(cache_dir, key):
+    return os.path.join(cache_dir, key + ".npy"), os.path.join(cache_dir, key + ".json")
+
+
+def load_cached_matrix(path, reader, cache_dir=default_cache_dir):
+    """
+    Loads a parsed SNP matrix from the cache, parsing and caching the workbook with reader on a miss.
+
+    Parameters:
+        path (str): Path to the matrix workbook.
+        reader (callable): Function that parses the workbook into a DataFrame or DistanceMatrix indexed by sample.
+        cache_dir (str): Directory holding the cached matrices.
+
+    Returns:
+        DistanceMatrix: The SNP matrix, backed by a read-only memory map when it came from the cache.
+    """
+    key = file_fingerprint(path)
+    values_path, labels_path = _entry_paths(cache_dir, key)
+
+    if os.path.exists(values_path) and os.path.exists(labels_path):
+        try:
+            with open(labels_path) as handle:
+                labels = json.load(handle)
+            values = np.load(values_path, mmap_mode='r')
+            # Touch the entry so eviction by age keeps recently used matrices
+            os.utime(labels_path)
+            if values.ndim == 2:
+                # Entry written before matrices were kept condensed
+                return DistanceMatrix.from_square(values, labels['index'])
+            return DistanceMatrix(values, labels['index'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable cache entry for {path}: {e}")
+
+    matrix_df = as_distance_matrix(reader(path))
+    try:
+        store_matrix(matrix_df, path, key, cache_dir)
+    except OSError as e:
+        print(f"Could not cache matrix {path}: {e}")
+    return matrix_df
+
+
+def store_matrix(matrix_df, path, key, cache_dir=default_cache_dir):
+    """
+    Writes a parsed SNP matrix to the cache as its condensed upper triangle plus its sample labels.
+
+    Parameters:
+        matrix_df (DistanceMatrix or pd.DataFrame): The SNP matrix indexed by sample.
+        path (str): Path of the workbook the matrix was parsed from.
+        key (str): Cache key returned by file_fingerprint.
+        cache_dir (str): Directory holding the cached matrices.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    values_path, labels_path = _entry_paths(cache_dir, key)
+
+    matrix_df = as_distance_matrix(matrix_df)
+    values = matrix_df.condensed
+
+    # An entry is only loaded once its labels exist, and those are written last
+    with atomic_write(values_path, 'wb') as handle:
+        np.save(handle, values)
+    with atomic_write(labels_path) as handle:
+        json.dump({
+            'source': os.path.abspath(path),
+            'index': [str(i) for i in matrix_df.index],
+        }, handle)
+
+
+def evict_cache(cache_dir=default_cache_dir, max_age_days=max_age_days, max_bytes=max_cache_bytes):
+    """
+    Removes cache entries not used within max_age_days, then the oldest entries until the cache fits in max_bytes.
+
+    Parameters:
+        cache_dir (str): Directory holding the cached matrices.
+        max_age_days (float): Age after which an unused entry is removed.
+        max_bytes (int): Largest total size the cache may keep.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    for file in os.listdir(cache_dir):
+        if not file.endswith(".json"):
+            continue
+        key = file[:-len(".json")]
+        values_path, labels_path = _entry_paths(cache_dir, key)
+        size = sum(os.path.getsize(p) for p in (values_path, labels_path) if os.path.exists(p))
+        entries.append((os.path.getmtime(labels_path), size, key))
+
+    entries.sort()  # Oldest first
+    total = sum(size for _, size, _ in entries)
+    oldest_allowed = time.time() - max_age_days * 86400
+    removed = 0
+    for last_used, size, key in entries:
+        if last_used >= oldest_allowed and total <= max_bytes:
+            break
+        for p in _entry_paths(cache_dir, key):
+            if os.path.exists(p):
+                os.remove(p)
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,76 @@
+# Import necessary libraries
+import numpy as np
+import pandas as pd
+import openpyxl
+from distance_matrix import DistanceMatrix, _narrow
+
+
+def _label(value, clean_label):
+    # Labels typed as numbers come back as int or float, HSNs are kept as their digits
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return clean_label(str(value))
+
+
+def _distances(cells):
+    # None (an empty cell) becomes NaN, text such as "NA" is coerced to NaN as well
+    try:
+        return np.array(cells, dtype=float)
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(cells, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+
+def read_matrix_workbook(path, clean_label=str):
+    """
+    Streams the first sheet of a SNP matrix workbook straight into a condensed DistanceMatrix. The sheet is read
+    row by row in read-only mode and only the cells right of the diagonal are kept, so memory grows with the
+    matrix itself and not with an object model of the workbook.
+
+    Parameters:
+        path (str): Path to the matrix workbook, sample labels in the first row and in the first column.
+        clean_label (callable): Normalizes a label, for example by removing the KS___ prefix.
+
+    Returns:
+        DistanceMatrix: The matrix, labelled with the cleaned column labels.
+
+    Raises:
+        ValueError: When the row labels do not match the column labels, in the same order.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        # Read-only sheets can report empty cells after the last label
+        while header and header[-1] is None:
+            header.pop()
+        labels = [_label(value, clean_label) for value in header[1:]]
+        n = len(labels)
+
+        missing = np.iinfo(np.uint16).max
+        condensed = np.empty(n * (n - 1) // 2, dtype=np.uint16)
+        largest = 0
+        start = 0
+        i = 0
+        for row in rows:
+            if row is None or all(value is None for value in row):
+                continue
+            if i >= n:
+                raise ValueError(f"{path} has more rows than its {n} column labels")
+            row_label = _label(row[0], clean_label)
+            if row_label != labels[i]:
+                raise ValueError(f"{path}: row {i + 1} is labelled {row_label} but column {i + 1} is labelled {labels[i]}")
+            # Cells i + 1 to n - 1 of row i, shorter rows end with empty cells
+            cells = list(row[i + 2:n + 1])
+            cells += [None] * (n - i - 1 - len(cells))
+            values = _distances(cells)
+            known = ~np.isnan(values)
+            if known.any():
+                largest = max(largest, values[known].max())
+            condensed[start:start + len(values)] = np.where(known, np.clip(values, 0, missing - 1), missing)
+            start += len(values)
+            i += 1
+        if i != n:
+            raise ValueError(f"{path} has {i} rows for {n} column labels")
+    finally:
+        workbook.close()
+    return DistanceMatrix(_narrow(condensed, largest), labels)
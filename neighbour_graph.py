@@ -0,0 +1,139 @@
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+import os
+from cluster_engine import matrix_pairs
+from file_utils import atomic_write
+
+
+# Largest SNP distance kept in the neighbour graphs, and the folder they are saved to in the results folder
+neighbour_distance = 20
+graph_folder = "neighbour_graphs"
+
+
+class NeighbourGraph:
+    """
+    Sparse graph of every pair of samples within max_distance SNPs, stored as CSR arrays:
+    the neighbours of the sample at position i are indices[indptr[i]:indptr[i + 1]], closest first.
+
+    Parameters:
+        labels (list): Sample label of every position.
+        indptr (np.ndarray): Start of every sample's neighbours in indices, n + 1 values.
+        indices (np.ndarray): Position of every neighbour.
+        distances (np.ndarray): SNP distance to every neighbour.
+        max_distance (int): Largest distance kept in the graph.
+    """
+
+    def __init__(self, labels, indptr, indices, distances, max_distance):
+        self.labels = np.asarray([str(label) for label in labels], dtype=object)
+        self.indptr = indptr
+        self.indices = indices
+        self.distances = distances
+        self.max_distance = max_distance
+        self._positions = {label: i for i, label in enumerate(self.labels)}
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def from_pairs(cls, labels, pair_i, pair_j, pair_distances, max_distance):
+        """Builds the graph from the pairs (i, j, distance) with i < j returned by the threshold scans."""
+        n = len(labels)
+        rows = np.concatenate([pair_i, pair_j])
+        cols = np.concatenate([pair_j, pair_i])
+        dists = np.concatenate([pair_distances, pair_distances])
+        # Group by sample, closest neighbours first
+        order = np.lexsort((cols, dists, rows))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(labels, indptr, cols[order].astype(np.int32), dists[order].astype(np.uint16), max_distance)
+
+    def neighbours(self, sample, max_distance=None):
+        """
+        Returns the samples within max_distance SNPs of one sample, closest first.
+
+        Parameters:
+            sample (str): Label of the sample, for example its HSN.
+            max_distance (int): Largest distance to return, defaults to every neighbour in the graph.
+
+        Returns:
+            list: (label, distance) tuples, empty when the sample is not in the graph.
+        """
+        i = self._positions.get(str(sample))
+        if i is None:
+            return []
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        distances = self.distances[start:stop]
+        if max_distance is not None:
+            # Neighbours are sorted by distance, so the ones within max_distance come first
+            stop = start + np.searchsorted(distances, max_distance, side='right')
+        return list(zip(self.labels[self.indices[start:stop]], self.distances[start:stop].tolist()))
+
+    def neighbours_of(self, samples, max_distance=None):
+        """
+        Returns the neighbours of several samples as one table.
+
+        Parameters:
+            samples (list): Labels of the samples.
+            max_distance (int): Largest distance to return, defaults to every neighbour in the graph.
+
+        Returns:
+            pd.DataFrame: One row per (Sample ID, Neighbour, SNP distance), samples in the given order.
+        """
+        rows = [(str(sample), neighbour, distance) for sample in samples for neighbour, distance in self.neighbours(sample, max_distance)]
+        return pd.DataFrame(rows, columns=['Sample ID', 'Neighbour', 'SNP distance'])
+
+
+def build_neighbour_graph(matrix, max_distance=neighbour_distance, blocks=None):
+    """
+    Builds the neighbour graph of a SNP matrix.
+
+    Parameters:
+        matrix (DistanceMatrix or pd.DataFrame): SNP distance matrix indexed by sample.
+        max_distance (int): Largest distance kept in the graph.
+        blocks (tuple): Optional allele code blocks, as returned by allele_index.prefix_blocks.
+
+    Returns:
+        NeighbourGraph: The graph.
+    """
+    pair_i, pair_j, pair_distances = matrix_pairs(matrix, max_distance, blocks)
+    return NeighbourGraph.from_pairs(matrix.index, pair_i, pair_j, pair_distances, max_distance)
+
+
+def graph_path(path_to_res, run_date, organism):
+    """Returns where the neighbour graph of an organism and run is saved."""
+    return os.path.join(path_to_res, graph_folder, f"{run_date} {organism} neighbours.npz")
+
+
+def save_neighbour_graph(graph, path):
+    """Saves a neighbour graph as a compressed .npz file, replacing the old file only once the new one is complete."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path, 'wb') as handle:
+        np.savez_compressed(handle, labels=graph.labels.astype(str), indptr=graph.indptr, indices=graph.indices,
+                            distances=graph.distances, max_distance=graph.max_distance)
+
+
+def load_neighbour_graph(path):
+    """
+    Loads a neighbour graph saved by save_neighbour_graph.
+
+    Parameters:
+        path (str): Path to the .npz file.
+
+    Returns:
+        NeighbourGraph: The graph.
+    """
+    with np.load(path) as data:
+        return NeighbourGraph(data['labels'].tolist(), data['indptr'], data['indices'], data['distances'], int(data['max_distance']))
+
+
+if __name__ == "__main__":
+    from cluster_finder_withEpiTrack import path_to_results
+
+    # Ask which graph to look in and which samples to look up
+    run_date = input("\nPlease enter the date of the cluster run in mmddyy format\n--> ")
+    organism = input("\nPlease enter the organism\n--> ")
+    graph = load_neighbour_graph(graph_path(path_to_results, run_date, organism))
+    samples = input("\nPlease enter the HSNs to look up, separated by commas\n--> ").split(",")
+    max_distance = input(f"\nPlease enter the largest SNP distance (at most {graph.max_distance}), or leave empty for all\n--> ")
+    print(graph.neighbours_of([s.strip() for s in samples], int(max_distance) if max_distance.strip() else None).to_string(index=False))
@@ -0,0 +1,50 @@
+# Import necessary libraries
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import Epi_report_90Day as epi_report
+import cluster_finder_withEpiTrack as cluster_finder
+from run_metrics import start_run, stage, finish_run
+from share_cache import wait_for_uploads
+
+# Suppresses all warnings
+warnings.filterwarnings('ignore')
+
+
+def run_pipeline(run_date):
+    """
+    Runs the 90-day Epi report and the cluster finder in one pass. The processed DataFrames of every organism are handed
+    to the cluster finder in memory, while the report workbook (and its columnar copy) is written in a background thread.
+
+    Parameters:
+        run_date (str): Date of the download in mmddyy format.
+
+    Returns:
+        tuple: Path to the Epi report and the list of cluster workbooks that were written.
+    """
+    # Add the new records of the Excel and CSV files to the 90-day window, read it back and process it once
+    combined_sheets = epi_report.update_window_sheets(epi_report.csv_directory, epi_report.xlsx_directory, run_date,
+                                                      os.path.join(epi_report.output_path, epi_report.store_folder))
+    processed_sheets = epi_report.process_combined_sheets(combined_sheets)
+
+    output_file = os.path.join(epi_report.output_path, f'{run_date} Epi report past 90.xlsx')
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The report is an output for people, nothing below waits on it
+        report = executor.submit(epi_report.write_report, processed_sheets, output_file, epi_report.columnar_path(output_file))
+        workbook_lst = cluster_finder.run_cluster_finder(run_date, demo_frames=processed_sheets)
+        saved_file = report.result()
+    # The report and its columnar copy are uploaded to the share in the background
+    with stage("upload"):
+        wait_for_uploads()
+    return saved_file, workbook_lst
+
+
+if __name__ == "__main__":
+
+    # Get the date from the user
+    run_date = input("\nPlease enter the date of the download you made in mmddyy format\n--> ")
+    start_run("pulsenet_pipeline", run_date, os.path.join(epi_report.output_path, "run_logs"))
+    run_pipeline(run_date)
+    finish_run()
+    print("The output was saved successfully!")
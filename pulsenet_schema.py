@@ -0,0 +1,195 @@
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+
+
+# Columns renamed when the exports are formatted
+rename_col_lst = {
+    "Date Modified": "Modified date"
+}
+
+# Columns removed when the exports are formatted
+columns_to_remove = [
+    "TAT in Calendar Days",
+    "TAT in Workdays (minus weekends/Holidays)",
+    "Comment",
+    "SequencedDate",
+    "PulseNet Upload Date",
+    "PatientAgeYears",
+    "PatientAgeMonths",
+    "PatientAgeDays"
+]
+
+# Define the CSV headers, in the order of the Epi report
+csv_headers = [
+    "Key",
+    "Modified date",
+    "WGS_id",
+    "ReceivedDate",
+    "LabReceivedDate",
+    "SequencerRun_id",
+    "Allele_Code",
+    "Outbreak",
+    "REP_code",
+    "NCBI_ACCESSION",
+    "SRR_id",
+    "LastName",
+    "FirstName",
+    "SourceCounty",
+    "SourceState",
+    "PatientDOB",
+    "PATIENTAGEYEARS",
+    "PATIENTAGEMONTHS",
+    "PATIENTAGEDAYS",
+    "SourceSite",
+    "PatientSex",
+    "IsolatDate",
+    "SourceCountry",
+    "SourceType",
+    "PulseNet_UploadDate",
+    "Genus",
+    "Species",
+    "MLST_ST",
+    "LabID",
+    "OtherStateIsolate",
+]
+
+# Sequencing results kept after the CSV headers, per organism
+organism_columns = {
+    "Salmonella": ["Serotype_wgs"],
+    "Escherichia": ["Serotype_wgs", "Toxin_wgs", "Escherichia_group"],
+}
+default_organism_columns = ["Serotype_wgs", "Toxin_wgs"]
+
+# Column used to drop the WGS_Databases rows that were never uploaded to PulseNet
+upload_date_column = "PulseNet Upload Date"
+
+# Declared types, columns that are not listed keep the type pandas infers.
+# Key holds integers and KS___ strings side by side, process_df relies on that so it is never declared.
+# Dates are datetime64, ages nullable integers, enumerated fields categoricals and free text strings.
+date_columns = [
+    "Date Modified",
+    "Modified date",
+    "ReceivedDate",
+    "LabReceivedDate",
+    "PatientDOB",
+    "IsolatDate",
+    "PulseNet_UploadDate",
+    upload_date_column,
+]
+integer_columns = ["PATIENTAGEYEARS", "PATIENTAGEMONTHS", "PATIENTAGEDAYS"]
+category_columns = [
+    "SequencerRun_id",
+    "Outbreak",
+    "SourceCounty",
+    "SourceState",
+    "SourceSite",
+    "PatientSex",
+    "SourceCountry",
+    "SourceType",
+    "Genus",
+    "Species",
+    "LabID",
+    "OtherStateIsolate",
+    "Serotype_wgs",
+    "Toxin_wgs",
+    "Escherichia_group",
+]
+text_columns = [
+    "WGS_id",
+    "Allele_Code",
+    "REP_code",
+    "NCBI_ACCESSION",
+    "SRR_id",
+    "LastName",
+    "FirstName",
+]
+
+
+def input_columns(organism):
+    """
+    Returns the columns read from the exports of an organism: the CSV headers under their export names,
+    the upload date used for filtering and the organism's sequencing results.
+
+    Parameters:
+        organism (str): Name of the organism, as used for the sheet names.
+
+    Returns:
+        list: The column names to read.
+    """
+    export_names = {new: old for old, new in rename_col_lst.items()}
+    columns = [export_names.get(col, col) for col in csv_headers]
+    columns += [upload_date_column] + organism_columns.get(organism, default_organism_columns)
+    return list(dict.fromkeys(columns))
+
+
+def column_type(col):
+    """Returns the declared type of a column: "datetime", "Int64", "category", str, or None when it is not declared."""
+    if col in date_columns:
+        return "datetime"
+    if col in integer_columns:
+        return "Int64"
+    if col in category_columns:
+        return "category"
+    if col in text_columns:
+        return str
+    return None
+
+
+def input_schema(organism):
+    """
+    Returns the declared type of every column read for an organism, see column_type.
+
+    Parameters:
+        organism (str): Name of the organism, as used for the sheet names.
+
+    Returns:
+        dict: Column name to type, only for the columns that have a declared type.
+    """
+    schema = {}
+    for col in input_columns(organism):
+        if column_type(col) is not None:
+            schema[col] = column_type(col)
+    return schema
+
+
+def frame_schema(df):
+    """Returns the declared type of every column of a DataFrame that has one, for tables already renamed or processed."""
+    return {col: column_type(col) for col in df.columns if column_type(col) is not None}
+
+
+def read_dtypes(schema):
+    """
+    Returns the dtype argument of read_csv/read_excel for a schema. Categoricals are read as text and ages as floats,
+    apply_schema converts them afterwards so a malformed cell becomes missing instead of failing the read.
+    """
+    read_as = {"Int64": "float64", "category": str}
+    return {col: read_as.get(dtype, dtype) for col, dtype in schema.items() if dtype != "datetime"}
+
+
+def apply_schema(df, schema=None):
+    """
+    Converts the columns of a DataFrame to their compact declared types in place: midnight datetime64 for dates
+    (values that are not dates become NaT), nullable integers for ages and categoricals for enumerated fields.
+    Columns already of their type are left as they are, so this is cheap to apply again after a concat or merge.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame to convert.
+        schema (dict): The schema returned by input_schema, defaults to frame_schema(df).
+
+    Returns:
+        pd.DataFrame: The same DataFrame.
+    """
+    if schema is None:
+        schema = frame_schema(df)
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype == "datetime":
+            df[col] = pd.to_datetime(df[col], errors='coerce').dt.normalize()
+        elif dtype == "Int64" and df[col].dtype != "Int64":
+            # Ages are whole numbers, a fractional age is truncated like a completed year
+            df[col] = np.floor(pd.to_numeric(df[col], errors='coerce')).astype("Int64")
+        elif dtype == "category" and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
@@ -0,0 +1,191 @@
+# Import necessary libraries
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Switches, read from the environment because both scripts only prompt for the run date:
+#   PULSENET_RUN_LOG_DIR   folder for the JSON run logs (defaults to the folder given to start_run)
+#   PULSENET_PROFILE       comma separated stage names to run under cProfile, or "all"
+#   PULSENET_TRACE_MEMORY  set to 1 to record peak traced memory, off by default because it slows Python heavy stages down
+_run = None
+# Stages open in each thread, so stages running in different threads do not nest into each other.
+# Traced memory is shared by the whole process, so the peaks of concurrent stages are approximate.
+_open = threading.local()
+
+
+def _open_stages():
+    if not hasattr(_open, "stages"):
+        _open.stages = []
+    return _open.stages
+
+
+def start_run(script, run_date, log_dir):
+    """
+    Starts recording a run. Every stage entered afterwards is added to the run's JSON log.
+
+    Parameters:
+        script (str): Name of the script being run.
+        run_date (str): Date of the run in mmddyy format.
+        log_dir (str): Default folder for the run log.
+
+    Returns:
+        str: Path the run log will be written to by finish_run.
+    """
+    global _run
+    log_dir = os.environ.get("PULSENET_RUN_LOG_DIR", log_dir)
+    started = datetime.now()
+    profile = os.environ.get("PULSENET_PROFILE", "")
+    _run = {
+        "path": os.path.join(log_dir, f"{run_date} {script} {started.strftime('%Y%m%d-%H%M%S')}.json"),
+        "record": {"script": script, "run_date": run_date, "started_at": started.isoformat(timespec='seconds'), "stages": []},
+        "profile": {name.strip() for name in profile.split(",") if name.strip()},
+        "trace_memory": os.environ.get("PULSENET_TRACE_MEMORY", "0") not in ("", "0"),
+        "peak": 0,
+        "start": time.perf_counter(),
+        "cpu_start": time.process_time(),
+    }
+    try:
+        os.makedirs(log_dir, exist_ok=True)
+    except OSError as e:
+        print(f"Could not create the run log folder {log_dir}: {e}")
+    if _run["trace_memory"] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return _run["path"]
+
+
+@contextmanager
+def stage(name, organism=None, **counts):
+    """
+    Records one stage of the run: wall time, CPU time, peak traced memory and any counts the caller sets.
+    Counts (rows_in, rows_out, files_in, files_out) can be passed up front or set on the yielded dict.
+    Does nothing but yield a dict when no run was started.
+    """
+    entry = {"stage": name, "organism": organism, "rows_in": None, "rows_out": None, "files_in": None, "files_out": None}
+    entry.update(counts)
+    if _run is None:
+        yield entry
+        return
+
+    tracing = _run["trace_memory"] and tracemalloc.is_tracing()
+    if tracing:
+        # The enclosing stage keeps the peak reached so far, then the peak is reset for this stage
+        peak = tracemalloc.get_traced_memory()[1]
+        _run["peak"] = max(_run["peak"], peak)
+        if _open_stages():
+            _open_stages()[-1]["peak_mem_bytes"] = max(_open_stages()[-1].get("peak_mem_bytes", 0), peak)
+        tracemalloc.reset_peak()
+    _open_stages().append(entry)
+
+    profiler = None
+    if "all" in _run["profile"] or name in _run["profile"]:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    started = datetime.now()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield entry
+    finally:
+        entry["wall_s"] = round(time.perf_counter() - wall_start, 4)
+        entry["cpu_s"] = round(time.process_time() - cpu_start, 4)
+        entry["started_at"] = started.isoformat(timespec='seconds')
+        if profiler is not None:
+            profiler.disable()
+            profile_path = os.path.splitext(_run["path"])[0] + f" {name}{' ' + organism if organism else ''}.prof"
+            try:
+                profiler.dump_stats(profile_path)
+                entry["profile"] = profile_path
+            except OSError as e:
+                print(f"Could not write the profile {profile_path}: {e}")
+        if tracing:
+            entry["peak_mem_bytes"] = max(entry.get("peak_mem_bytes", 0), tracemalloc.get_traced_memory()[1])
+            _run["peak"] = max(_run["peak"], entry["peak_mem_bytes"])
+        _open_stages().pop()
+        if tracing and _open_stages():
+            _open_stages()[-1]["peak_mem_bytes"] = max(_open_stages()[-1].get("peak_mem_bytes", 0), entry["peak_mem_bytes"])
+        _run["record"]["stages"].append(entry)
+
+
+def worker_settings():
+    """Returns what a worker process needs to record its stages for the current run, None when no run was started."""
+    if _run is None:
+        return None
+    return {"path": _run["path"], "profile": sorted(_run["profile"]), "trace_memory": _run["trace_memory"]}
+
+
+def run_in_worker(settings, func, *args):
+    """
+    Runs func(*args) in a worker process, recording its stages like start_run would in the parent.
+
+    Parameters:
+        settings (dict): Settings returned by worker_settings in the parent, None to record nothing.
+        func (callable): Function to run.
+        *args: Arguments of func.
+
+    Returns:
+        tuple: What func returned, and the stages it recorded, to be passed to add_stages in the parent.
+    """
+    global _run
+    if settings is None:
+        return func(*args), []
+    _run = {
+        "path": settings["path"],
+        "record": {"stages": []},
+        "profile": set(settings["profile"]),
+        "trace_memory": settings["trace_memory"],
+        "peak": 0,
+    }
+    _open.stages = []
+    started_tracing = _run["trace_memory"] and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        return func(*args), _run["record"]["stages"]
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _run = None
+
+
+def add_stages(stages):
+    """Adds the stages recorded by run_in_worker to the current run, each marked as coming from a worker process."""
+    if _run is None:
+        return
+    for entry in stages:
+        entry["worker"] = True
+        _run["record"]["stages"].append(entry)
+
+
+def finish_run():
+    """
+    Writes the run log as JSON and stops recording.
+
+    Returns:
+        str: Path of the run log, or None when no run was started or it could not be written.
+    """
+    global _run
+    if _run is None:
+        return None
+    record = _run["record"]
+    record["wall_s"] = round(time.perf_counter() - _run["start"], 4)
+    record["cpu_s"] = round(time.process_time() - _run["cpu_start"], 4)
+    if _run["trace_memory"] and tracemalloc.is_tracing():
+        record["peak_mem_bytes"] = max(_run["peak"], tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    path = _run["path"]
+    _run = None
+    try:
+        with open(path, 'w') as handle:
+            json.dump(record, handle, indent=2, default=str)
+    except OSError as e:
+        print(f"Could not write the run log {path}: {e}")
+        return None
+    print(f"Run log written to {path}")
+    return path
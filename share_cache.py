@@ -0,0 +1,187 @@
+# Import necessary libraries
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from file_utils import atomic_write
+
+
+# Root of the network share used in the script paths. Setting PULSENET_SHARE_ROOT to another folder
+# (for example a local copy of the share for testing) makes every script use that folder instead.
+share_prefix = "//kdhe/dfs"
+
+# Local mirror of the share, the number of files copied at the same time and when an unused copy is removed.
+# default_cache_dir is read when a function is called, so it can be pointed elsewhere (for example by the benchmarks).
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".pulsenet_cache", "share")
+copy_workers = 8
+max_age_days = 30
+
+# Modification times on the share are only kept to 2 seconds
+mtime_tolerance = 2
+
+# Uploads started by upload and not yet waited for
+_uploads = []
+_upload_pool = None
+
+
+def share_path(path):
+    """
+    Returns path with the share root replaced by PULSENET_SHARE_ROOT when it is set.
+
+    Parameters:
+        path (str): A path on the share, starting with share_prefix.
+
+    Returns:
+        str: The path to use.
+    """
+    root = os.environ.get("PULSENET_SHARE_ROOT")
+    if root and path.lower().startswith(share_prefix.lower()):
+        return root.rstrip("/\\") + path[len(share_prefix):]
+    return path
+
+
+def mirror_path(path, cache_dir=None):
+    """Returns where a file of the share is mirrored in the local cache (default_cache_dir unless given), keeping its folders and name."""
+    cache_dir = cache_dir or default_cache_dir
+    relative = os.path.abspath(path) if not path.startswith(("//", "\\\\")) else path
+    relative = relative.replace("\\", "/").replace(":", "").lstrip("/")
+    return os.path.join(cache_dir, *relative.split("/"))
+
+
+def _is_fresh(source_stat, local_path):
+    # The local copy is valid while the source keeps the size and modification time it was copied with
+    try:
+        local_stat = os.stat(local_path)
+    except OSError:
+        return False
+    return local_stat.st_size == source_stat.st_size and abs(local_stat.st_mtime - source_stat.st_mtime) <= mtime_tolerance
+
+
+def cached_copy(path, cache_dir=None):
+    """
+    Returns a local copy of a file on the share, copying it only when the cached copy is missing or stale.
+
+    Parameters:
+        path (str): Path to the file on the share.
+        cache_dir (str): Directory holding the local mirror, defaults to default_cache_dir.
+
+    Returns:
+        str: Path of the local copy, or path itself when it could not be cached.
+    """
+    local_path = mirror_path(path, cache_dir)
+    try:
+        source_stat = os.stat(path)
+    except FileNotFoundError:
+        # Never serve a copy of a file that was removed from the share
+        if os.path.exists(local_path):
+            os.remove(local_path)
+        return path
+
+    try:
+        if not _is_fresh(source_stat, local_path):
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            _copy_file(path, local_path)
+        # The access time records the last use, the modification time stays the one of the share
+        os.utime(local_path, (time.time(), os.stat(local_path).st_mtime))
+        return local_path
+    except OSError as e:
+        print(f"Could not cache {path}, reading it from the share: {e}")
+        return path
+
+
+def prefetch(paths, cache_dir=None, max_workers=copy_workers):
+    """
+    Copies files of the share to the local cache concurrently.
+
+    Parameters:
+        paths (list): Paths to the files on the share.
+        cache_dir (str): Directory holding the local mirror, defaults to default_cache_dir.
+        max_workers (int): Number of files copied at the same time.
+
+    Returns:
+        list: The local path of every file, in the same order (the original path when it could not be cached).
+    """
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as executor:
+        return list(executor.map(lambda path: cached_copy(path, cache_dir), paths))
+
+
+def staging_path(path, cache_dir=None):
+    """Returns the local path an output for the share is written to before upload, creating its folder."""
+    local_path = mirror_path(path, cache_dir)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    return local_path
+
+
+def _copy_file(source, target):
+    # Copies a file with its modification time, readers of target never see a partial copy
+    with open(source, 'rb') as source_handle, atomic_write(target, 'wb') as handle:
+        shutil.copyfileobj(source_handle, handle)
+        handle.flush()
+        shutil.copystat(source, handle.name)
+
+
+def _copy_to_share(local_path, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _copy_file(local_path, path)
+    return path
+
+
+def upload(local_path, path):
+    """
+    Starts copying a file written locally to its place on the share, in a background thread.
+    The local file stays in the cache as the mirror of the uploaded one.
+
+    Parameters:
+        local_path (str): The local file, usually from staging_path.
+        path (str): Path of the file on the share.
+    """
+    global _upload_pool
+    if os.path.abspath(local_path) == os.path.abspath(path):
+        return
+    if _upload_pool is None:
+        _upload_pool = ThreadPoolExecutor(max_workers=copy_workers)
+    _uploads.append((path, _upload_pool.submit(_copy_to_share, local_path, path)))
+
+
+def wait_for_uploads():
+    """
+    Waits for every upload started so far.
+
+    Returns:
+        int: Number of uploads that failed, each one is also printed with the local file it was copied from.
+    """
+    failed = 0
+    while _uploads:
+        path, future = _uploads.pop(0)
+        try:
+            future.result()
+        except OSError as e:
+            failed += 1
+            print(f"Could not upload {path}, the output is kept in the local cache at {mirror_path(path)}: {e}")
+    return failed
+
+
+def evict_share_cache(cache_dir=None, max_age_days=max_age_days):
+    """
+    Removes the copies in the local mirror that were not used within max_age_days.
+
+    Returns:
+        int: Number of files removed.
+    """
+    cache_dir = cache_dir or default_cache_dir
+    if not os.path.isdir(cache_dir):
+        return 0
+    oldest_allowed = time.time() - max_age_days * 86400
+    removed = 0
+    for folder, _, files in os.walk(cache_dir):
+        for file in files:
+            local_path = os.path.join(folder, file)
+            try:
+                if os.stat(local_path).st_atime < oldest_allowed:
+                    os.remove(local_path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
@@ -0,0 +1,85 @@
+# Frozen copy of process_df as it was before the Key classification was vectorized, kept as the reference of
+# test_process_df. It is unchanged except for one guard: pandas 3 stores the missing values of the 'strings' column
+# as NaN instead of None, so the KS prefix test checks isinstance(x, str) instead of x. On pandas 2 both are the same.
+import pandas as pd
+from Epi_report_90Day import format_df
+
+
+def legacy_process_df(df):
+    """
+    Adds columns (PatientDOB, LastName and FirstName) and matches them according to the numeric/integer values in Key column
+    with the numeric part of the Key column which starts with KS___ , while including other string Key values specific to each DataFrame.
+    
+    Parameters:
+        df (pd.DataFrame): The DataFrame to be merged or combined.
+    
+    Returns:
+        pd.DataFrame: Combined DataFrame with columns (PatientDOB, LastName and FirstName) added based on the match/mapping of values starting from KS___ with the integer value in the Key column.
+    """
+
+    if 'Key' not in df.columns:
+        print("Warning: 'Key' column not found in DataFrame. Skipping processing.")
+        return format_df(df)  # Format DataFrame before returning
+
+    # Ensure 'Key' column is of object type to handle mixed types
+    df['Key'] = df['Key'].astype(object)
+
+    # Identify datatypes
+    df['type'] = df['Key'].apply(lambda x: type(x).__name__)
+
+    # Separate columns based on datatype
+    df['integers'] = df['Key'].apply(lambda x: x if isinstance(x, int) else None)
+    df['strings'] = df['Key'].apply(lambda x: x if isinstance(x, str) else None)
+    
+    # Convert 'integers' column to numeric, handling errors by coercing them to NaN
+    df['integers'] = pd.to_numeric(df['integers'], errors='coerce').astype('Int64')
+
+    # Ensure 'strings' column only contains non-numeric values
+    df['strings'] = df['strings'].apply(lambda x: x if isinstance(x, str) and not x.isnumeric() else None)
+    
+    # Extract numeric part from strings starting with 'KS'
+    df['numeric_part'] = df['strings'].apply(lambda x: ''.join(filter(str.isdigit, x)) if isinstance(x, str) and x.startswith('KS') else None)
+    
+    # Create new DataFrames for integers and strings
+    df_integers = df.dropna(subset=['integers']).drop(columns=['Key', 'type', 'strings', 'numeric_part'])
+    df_strings = df.dropna(subset=['strings']).drop(columns=['Key', 'type', 'integers', 'numeric_part'])
+    
+    # Create DataFrame with numeric parts starting with 'KS'
+    df_numeric = df.dropna(subset=['numeric_part'])
+    df_numeric['numeric_part'] = pd.to_numeric(df_numeric['numeric_part'], errors='coerce').astype('Int64')
+    df_numeric = df_numeric.drop(columns=['Key', 'type', 'integers', 'strings'])
+
+    # Rename columns to avoid conflicts in merge
+    df_integers.rename(columns={'integers': 'Key'}, inplace=True)
+    df_numeric.rename(columns={'numeric_part': 'Key'}, inplace=True)
+
+    # Set 'Key' as index for both DataFrames
+    df_integers.set_index('Key', inplace=True)
+    df_numeric.set_index('Key', inplace=True)
+
+    # Combine the DataFrames
+    merged_df = df_numeric.combine_first(df_integers)
+
+    # Reset index to turn 'Key' back into a column
+    merged_df.reset_index(inplace=True)
+
+    # Drop duplicates in df_strings while keeping the last occurrence
+    df_strings = df_strings.drop_duplicates(subset=['strings'], keep='last')
+    # Remove rows where 'strings' starts with 'KS'
+    df_strings = df_strings[~df_strings['strings'].str.startswith('KS___', na=False)]
+    df_strings.rename(columns={'strings': 'Key'}, inplace=True)
+
+    # Set 'Key' as index for both DataFrames
+    df_strings.set_index('Key', inplace=True)
+    merged_df.set_index('Key', inplace=True)
+
+    final_df = df_strings.combine_first(merged_df)
+
+    # Reset index to turn 'Key' back into a column
+    final_df.reset_index(inplace=True)
+
+    # Drop duplicate columns
+    final_df = final_df.loc[:, ~final_df.columns.duplicated()]
+
+    # Format DataFrame before returning (This step is necessary)
+    return format_df(final_df)
@@ -0,0 +1,56 @@
+# Checks that process_df gives the same table as the implementation it replaced, see legacy_process_df
+import os
+import sys
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Epi_report_90Day import process_df
+from legacy_process_df import legacy_process_df
+
+
+def make_sheet(keys):
+    # A combined sheet: the KS___ rows of the databases hold the names, the numeric rows of the exports the rest
+    n = len(keys)
+    return pd.DataFrame({
+        'Key': pd.Series(keys, dtype=object),
+        'Date Modified': pd.to_datetime(['2026-09-01'] * n) + pd.to_timedelta(range(n), unit='D'),
+        'WGS_id': [f"KS-WGS-{i}" for i in range(n)],
+        'LastName': [f"Last{i}" if i % 2 == 0 else None for i in range(n)],
+        'FirstName': [f"First{i}" if i % 3 else None for i in range(n)],
+        'SourceCounty': [['Riley', 'Sedgwick', None][i % 3] for i in range(n)],
+        'PATIENTAGEYEARS': [float(i) if i % 4 else None for i in range(n)],
+        'Comment': ['dropped'] * n,
+    })
+
+
+sheets = {
+    "int and KS___ keys": [24001, "KS___24001", 24002, "KS___24003", 24004],
+    "numeric strings": [24001, "KS___24001", "24002", "24003"],
+    "other strings": [24001, "KS___24001", "PN-OTHER-1", "PN-OTHER-2", "PN-OTHER-1"],
+    "None keys": [24001, None, "KS___24001", None],
+    "float keys": [24001, 24002.0, "KS___24002", float('nan')],
+    "every kind": [24001, "KS___24001", "24002", "PN-OTHER-1", None, 24003.0, True, "KS___24005", 24005, "KS-7"],
+    "only strings": ["KS___24001", "KS___24002", "PN-OTHER-1"],
+}
+
+
+@pytest.mark.parametrize("keys", list(sheets.values()), ids=list(sheets.keys()))
+def test_process_df_matches_legacy(keys):
+    assert_frame_equal(process_df(make_sheet(keys)), legacy_process_df(make_sheet(keys)))
+
+
+def test_process_df_without_key():
+    sheet = make_sheet([1, 2]).drop(columns='Key')
+    assert_frame_equal(process_df(sheet.copy()), legacy_process_df(sheet.copy()))
+
+
+def test_process_df_leaves_input_unchanged():
+    sheet = make_sheet(sheets["every kind"])
+    before = sheet.copy()
+    process_df(sheet)
+    assert_frame_equal(sheet, before)
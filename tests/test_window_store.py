@@ -0,0 +1,62 @@
+# Checks that the window store gives the same report after a daily update as a store rebuilt from the same inputs
+import os
+import sys
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+pytest.importorskip("pyarrow")
+
+import share_cache
+import window_store
+from Epi_report_90Day import update_window_sheets, process_df
+from synthetic_data import write_run_inputs
+
+
+def update(inputs, run_date, store_dir):
+    return update_window_sheets(os.path.join(inputs, "PNExports"), os.path.join(inputs, "WGS_Databases"), run_date, store_dir, max_workers=1)
+
+
+def assert_same_reports(daily, rebuilt):
+    assert sorted(daily) == sorted(rebuilt)
+    for sheet_name in daily:
+        assert_frame_equal(process_df(daily[sheet_name]), process_df(rebuilt[sheet_name]))
+
+
+@pytest.fixture(autouse=True)
+def private_share_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(share_cache, "default_cache_dir", str(tmp_path / "share_cache"))
+
+
+def test_next_day_matches_rebuild(tmp_path):
+    # The second day's inputs rewrite the WGS_Databases workbook, which changes the Keys of some of its rows
+    inputs = str(tmp_path / "in")
+    write_run_inputs(inputs, 80, "101826", matrix_workbook=False)
+    update(inputs, "101826", str(tmp_path / "store"))
+    write_run_inputs(inputs, 80, "101926", matrix_workbook=False)
+    daily = update(inputs, "101926", str(tmp_path / "store"))
+    assert_same_reports(daily, update(inputs, "101926", str(tmp_path / "rebuilt")))
+
+
+def test_removed_workbook_leaves_the_store(tmp_path):
+    inputs = str(tmp_path / "in")
+    paths = write_run_inputs(inputs, 40, "101826", matrix_workbook=False)["paths"]
+    update(inputs, "101826", str(tmp_path / "store"))
+    os.remove(paths["wgs_database"])
+    daily = update(inputs, "101826", str(tmp_path / "store"))
+    assert_same_reports(daily, update(inputs, "101826", str(tmp_path / "rebuilt")))
+
+
+def test_rewritten_key_replaces_the_stored_record(tmp_path):
+    store_dir = str(tmp_path / "store")
+    uploaded = pd.to_datetime(["2026-10-01"] * 3)
+    first = pd.DataFrame({'Key': ['KS___101', 'KS___102', 'KS___103'], 'PulseNet Upload Date': uploaded, 'LastName': ['A', 'B', 'C']})
+    second = first.assign(Key=pd.Series(['KS___101', 102, 'KS___103'], dtype=object))
+    window_store.append_records(store_dir, "Salmonella", [("db.xlsx", first)], "101826")
+    window_store.append_records(store_dir, "Salmonella", [("db.xlsx", second)], "101926")
+    window = window_store.read_window(store_dir, "Salmonella", "101926")
+    assert window['Key'].tolist() == ['KS___101', 102, 'KS___103']
@@ -0,0 +1,351 @@
+# Import necessary libraries
+import pandas as pd
+import numpy as np
+import json
+import os
+from datetime import datetime, timedelta
+from pulsenet_schema import upload_date_column, apply_schema
+from file_utils import atomic_write
+
+
+# Days of uploads kept in the window, and the folder of the store in the Epi report folder
+window_days = 90
+store_folder = "window_store"
+sources_name = "sources.json"
+# Version of the store layout recorded with the sources, a store of another version is rebuilt from the input files
+store_version = 2
+store_lock = "window_store.lock"
+
+# Columns a record is dated and versioned by, in the WGS_Databases workbooks and in the PN exports
+partition_columns = [upload_date_column, "PulseNet_UploadDate"]
+modified_columns = ["Date Modified", "Modified date"]
+
+# Columns the store adds to every record: its kind of source and file, whether its Key was a number and its version
+source_column = "_source"
+file_column = "_file"
+key_int_column = "_key_int"
+modified_column = "_modified"
+store_columns = [source_column, file_column, key_int_column, modified_column]
+
+# Sources in the order their records are handed to process_df, like the files were read before the store
+source_order = ["database", "export"]
+
+
+def run_day(run_date):
+    """Returns the day of a run date in mmddyy format."""
+    return pd.Timestamp(datetime.strptime(run_date, "%m%d%y"))
+
+
+def in_window(days, run_date, window=window_days):
+    """Returns which of the days fall in the window of a run: after the run day minus the window and up to the run day."""
+    end = run_day(run_date)
+    return (days > end - timedelta(days=window)) & (days <= end)
+
+
+def file_source(path):
+    """Returns the source of an input file: "database" for the WGS_Databases workbooks and "export" for the PN exports."""
+    return "database" if path.endswith('.xlsx') else "export"
+
+
+def _first_date(df, columns):
+    # First date found in columns, NaT when none of them is set
+    dates = pd.Series(pd.NaT, index=df.index, dtype='datetime64[us]')
+    for col in columns:
+        if col in df.columns:
+            dates = dates.fillna(pd.to_datetime(df[col], errors='coerce').dt.normalize())
+    return dates
+
+
+def prepare_records(df, path, run_date):
+    """
+    Adds the store columns to records read from an input file. Records whose Key is neither a number nor text are
+    dropped, process_df never keeps them. Keys are stored as text with a flag for the ones that were numbers.
+
+    Parameters:
+        df (pd.DataFrame): Records read from one input file.
+        path (str): Path to the file, its source is given by file_source.
+        run_date (str): Date of the run in mmddyy format, the day of records without an upload date.
+
+    Returns:
+        tuple: The records with the store columns and the day of every record.
+    """
+    key = df['Key'].astype(object)
+    key_type = key.map(type)
+    is_int = key_type.isin([int, bool])
+    df = df[is_int | (key_type == str)].copy()
+    df[key_int_column] = is_int[df.index]
+    df['Key'] = key[df.index].map(lambda value: str(int(value)) if isinstance(value, (int, bool)) else value).astype(object)
+    df[source_column] = file_source(path)
+    df[file_column] = path
+    df[modified_column] = _first_date(df, modified_columns)
+    days = _first_date(df, partition_columns).fillna(run_day(run_date))
+    return df, days
+
+
+def partition_path(store_dir, organism, day):
+    """Returns the partition holding the records of an organism uploaded on a day."""
+    return os.path.join(store_dir, organism, day.strftime("%Y-%m-%d") + ".parquet")
+
+
+def list_partitions(store_dir, organism):
+    """Returns the partitions of an organism as a dictionary of day to path, oldest first."""
+    folder = os.path.join(store_dir, organism)
+    if not os.path.isdir(folder):
+        return {}
+    days = sorted(file[:-len(".parquet")] for file in os.listdir(folder) if file.endswith(".parquet"))
+    return {pd.Timestamp(day): os.path.join(folder, day + ".parquet") for day in days}
+
+
+def list_organisms(store_dir):
+    """Returns the organisms that have partitions in the store."""
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(folder for folder in os.listdir(store_dir) if list_partitions(store_dir, folder))
+
+
+def _read_partition(path, columns=None):
+    import pyarrow.parquet as pq
+    return pq.read_table(path, columns=columns).to_pandas(date_as_object=False)
+
+
+def _write_partition(df, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = df.reset_index(drop=True)
+    # Columns outside the schema are read untyped and can mix numbers and text, Parquet columns have one type
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+            df[col] = df[col].map(lambda value: value if pd.isna(value) else str(value)).astype(object)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with atomic_write(path, 'wb') as handle:
+        pq.write_table(table, handle)
+
+
+def _versions(store_dir, organism):
+    # Source, file, Key and version of every stored record with the day of its partition, without reading the other columns
+    frames = []
+    for day, path in list_partitions(store_dir, organism).items():
+        versions = _read_partition(path, columns=[source_column, file_column, 'Key', modified_column])
+        versions['day'] = day
+        frames.append(versions)
+    if not frames:
+        return pd.DataFrame({source_column: pd.Series(dtype=object), file_column: pd.Series(dtype=object),
+                             'Key': pd.Series(dtype=object), modified_column: pd.Series(dtype='datetime64[us]'),
+                             'day': pd.Series(dtype='datetime64[us]')})
+    return pd.concat(frames, ignore_index=True)
+
+
+def _rewrite_partitions(store_dir, organism, days, keep, new=None):
+    # Rewrites the partitions of the days with the stored records keep(partition) selects, then the new records of that day
+    for day in sorted(days):
+        path = partition_path(store_dir, organism, day)
+        parts = []
+        if os.path.exists(path):
+            current = _read_partition(path)
+            parts.append(current[keep(current, day)])
+        if new is not None:
+            parts.append(new[new['day'] == day].drop(columns='day'))
+        parts = [part for part in parts if not part.empty]
+        if parts:
+            _write_partition(pd.concat(parts, ignore_index=True), path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def append_records(store_dir, organism, frames, run_date, days=window_days):
+    """
+    Adds the records of the input files read for an organism to the store. A database workbook is read whole, so its
+    records replace every record stored from that file, and records deleted from it or whose Key was rewritten leave
+    the store. Export records are identified by their Key and replace the stored one when their modification date is
+    later, or when either has none, so the records of the exports of earlier days stay in the window. Only the partitions
+    that gain or lose records are rewritten, records older than the window are not stored. Records uploaded after the
+    run day are stored, so running an earlier date again does not lose them.
+
+    Parameters:
+        store_dir (str): Folder of the store.
+        organism (str): Name of the organism, as used for the sheet names.
+        frames (list): (path, DataFrame) of every file read for the organism, in reading order. The DataFrame is
+            None for a file read without any record, which still removes the records stored from it.
+        run_date (str): Date of the run in mmddyy format.
+        days (int): Length of the window in days.
+
+    Returns:
+        int: Number of records appended.
+    """
+    replaced_files = {path for path, _ in frames if file_source(path) == "database"}
+    prepared = [prepare_records(df, path, run_date) for path, df in frames if df is not None and 'Key' in df.columns]
+    if not prepared and not replaced_files:
+        return 0
+    stored = _versions(store_dir, organism)
+    if prepared:
+        new = pd.concat([df for df, _ in prepared], ignore_index=True)
+        new['day'] = pd.concat([day for _, day in prepared], ignore_index=True).to_numpy()
+        new = new[new['day'] > run_day(run_date) - timedelta(days=days)]
+    else:
+        new = stored.iloc[:0].copy()
+
+    # Within the exports read, the latest version of every record wins, then the last one read
+    is_export = (new[source_column] == "export").to_numpy()
+    exports = new[is_export].sort_values(modified_column, kind='stable', na_position='first')
+    exports = exports.drop_duplicates(subset=[source_column, 'Key'], keep='last')
+
+    stored_exports = stored[stored[source_column] == "export"].drop_duplicates(subset=[source_column, 'Key'], keep='last')
+    compared = exports[[source_column, 'Key', modified_column]].merge(
+        stored_exports, on=[source_column, 'Key'], how='left', suffixes=('', '_stored'), indicator=True)
+    is_new = (compared['_merge'] == 'left_only').to_numpy()
+    unversioned = (compared[modified_column].isna() | compared[modified_column + '_stored'].isna()).to_numpy()
+    is_later = (compared[modified_column] > compared[modified_column + '_stored']).to_numpy()
+    keep = is_new | unversioned | is_later
+    replaced = compared[keep & ~is_new]
+    new = pd.concat([new[~is_export], exports[keep]]).sort_index()
+
+    # Rewrite every partition that gains a record, loses one to a later version or holds records of a re-read workbook
+    gone_ids = set(zip(replaced[source_column], replaced['Key']))
+    def keep_stored(current, day):
+        kept = ~current[file_column].isin(replaced_files).to_numpy()
+        if gone_ids:
+            kept &= np.array([ident not in gone_ids for ident in zip(current[source_column], current['Key'])], dtype=bool)
+        return kept
+    stale_days = set(stored.loc[stored[file_column].isin(replaced_files), 'day'])
+    _rewrite_partitions(store_dir, organism, set(new['day']) | set(replaced['day']) | stale_days, keep_stored, new)
+    return len(new)
+
+
+def remove_files(store_dir, paths):
+    """
+    Removes the records stored from input files, for example the workbooks deleted from the databases folder.
+
+    Parameters:
+        store_dir (str): Folder of the store.
+        paths (list): Paths to the files, as given to append_records.
+
+    Returns:
+        int: Number of partitions rewritten.
+    """
+    paths = set(paths)
+    if not paths:
+        return 0
+    rewritten = 0
+    for organism in list_organisms(store_dir):
+        stored = _versions(store_dir, organism)
+        days = set(stored.loc[stored[file_column].isin(paths), 'day'])
+        _rewrite_partitions(store_dir, organism, days, lambda current, day: ~current[file_column].isin(paths).to_numpy())
+        rewritten += len(days)
+    return rewritten
+
+
+def clear_store(store_dir):
+    """Removes every partition of the store, which is then rebuilt from the input files."""
+    for organism in list_organisms(store_dir):
+        for path in list_partitions(store_dir, organism).values():
+            os.remove(path)
+
+
+def evict_partitions(store_dir, run_date, days=window_days):
+    """
+    Removes the partitions of every organism that are older than the window, see in_window.
+
+    Returns:
+        int: Number of partitions removed.
+    """
+    oldest_day = run_day(run_date) - timedelta(days=days)
+    removed = 0
+    for organism in list_organisms(store_dir):
+        for day, path in list_partitions(store_dir, organism).items():
+            if day <= oldest_day:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def read_window(store_dir, organism, run_date, columns=None, days=window_days):
+    """
+    Reads every record of an organism in the window of a run, as process_df expects them: database records before
+    export records, Keys that were numbers as integers again and the store columns removed. Partitions outside the
+    window, see in_window, are not read even when they are still in the store.
+
+    Parameters:
+        store_dir (str): Folder of the store.
+        organism (str): Name of the organism, as used for the sheet names.
+        run_date (str): Date of the run in mmddyy format.
+        columns (list): Columns of the records, see window_columns. Defaults to every column stored, which can
+            include columns of files whose records have left the store.
+        days (int): Length of the window in days.
+
+    Returns:
+        pd.DataFrame: The records with the compact schema types, None when the organism has no records in the window.
+    """
+    partitions = list_partitions(store_dir, organism)
+    kept = in_window(pd.DatetimeIndex(list(partitions)), run_date, days)
+    frames = [_read_partition(path) for path, keep in zip(partitions.values(), kept) if keep]
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    # Database records are grouped by workbook, ordered by path, so the order does not depend on when each was appended
+    order = df[source_column].astype(object).map({source: i for i, source in enumerate(source_order)})
+    files = df[file_column].astype(object).where(df[source_column] == "database", "")
+    df = df.iloc[np.lexsort([files.to_numpy(dtype=str), order.to_numpy()])].reset_index(drop=True)
+
+    key = df['Key'].astype(object)
+    is_int = df[key_int_column].to_numpy(dtype=bool)
+    key[is_int] = [int(value) for value in key[is_int]]
+    df['Key'] = key
+    df = df.drop(columns=store_columns)
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    return apply_schema(df)
+
+
+def load_sources(store_dir):
+    """
+    Returns the input files already appended to the store, see file_entry, empty for a store of another version.
+    """
+    try:
+        with open(os.path.join(store_dir, sources_name)) as handle:
+            sources = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(sources, dict) or sources.get("version") != store_version:
+        return {}
+    return sources.get("files", {})
+
+
+def save_sources(store_dir, sources):
+    """Saves the input files appended to the store, in reading order, replacing the old list only once the new one is complete."""
+    path = os.path.join(store_dir, sources_name)
+    with atomic_write(path) as handle:
+        json.dump({"version": store_version, "files": sources}, handle, indent=1)
+
+
+def file_state(path):
+    """Returns the size and modification time of a file, which change whenever it is saved again."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime]
+
+
+def file_entry(state, sheet_name, df):
+    """
+    Returns what the sources list keeps of an input file appended to the store.
+
+    Parameters:
+        state (list): Size and modification time of the file, see file_state.
+        sheet_name (str): Organism the file was read for.
+        df (pd.DataFrame): Records read from the file, None when it had none.
+
+    Returns:
+        dict: The state, the organism and the columns the file was read with (None when its records are not stored).
+    """
+    columns = list(df.columns) if df is not None and 'Key' in df.columns else None
+    return {"state": state, "sheet": sheet_name, "columns": columns}
+
+
+def window_columns(sources, organism):
+    """
+    Returns the columns of an organism's window: the columns of the input files listed in sources for the organism,
+    in reading order. Records kept from files that are no longer listed, such as the exports of earlier days, are
+    reported with these columns, like a store rebuilt from the files listed. None when no file listed has records of
+    the organism, read_window then keeps every stored column.
+    """
+    columns = [col for entry in sources.values() if entry["sheet"] == organism and entry["columns"] for col in entry["columns"]]
+    return list(dict.fromkeys(columns)) or None